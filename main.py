@@ -11,15 +11,38 @@ Version: 1.1.0
 
 import sys
 import os
+import atexit
+import multiprocessing
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-import customtkinter as ctk
-from src.app import main
-
 if __name__ == "__main__":
+    # Needed for bulk processing worker processes in frozen builds
+    multiprocessing.freeze_support()
+
+    if len(sys.argv) > 1:
+        # Headless commands (update, status, ...) never load the GUI toolkit
+        from src.cli import main as cli_main
+        sys.exit(cli_main())
+
+    # Only one tray app per user; a second launch opens the running one's settings
+    from src.config import Config
+    from src.instance import SingleInstance, forward_to_running_instance
+
+    apod_folder = Config().apod_folder
+    instance = SingleInstance(apod_folder)
+    if not instance.acquire():
+        if forward_to_running_instance(apod_folder, "settings") is None:
+            print("APODPaper is already running but not responding", file=sys.stderr)
+        sys.exit(0)
+    # Also covers exits other than Quit (errors, Ctrl+C); releasing twice is harmless
+    atexit.register(instance.release)
+
+    import customtkinter as ctk
+    from src.app import main
+
     root = ctk.CTk()
     from src.gui import WindowUtils
     WindowUtils.set_window_icon(root)
     root.withdraw()
-    main(root)
+    main(root, instance)
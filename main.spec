@@ -43,7 +43,6 @@ a = Analysis(
         'customtkinter',
         'PIL._tkinter_finder',
         'pystray._win32',
-        'schedule',
         'requests',
         'tkinter',
         'tkinter.ttk',
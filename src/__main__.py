@@ -0,0 +1,8 @@
+"""
+Run the headless APODPaper CLI with `python -m src`
+"""
+import sys
+
+from .cli import main
+
+sys.exit(main())
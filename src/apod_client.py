@@ -2,20 +2,112 @@
 NASA APOD API integration
 """
 import os
+import re
+import glob
+import time
+import socket
 import requests
 import random
+import threading
 from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+try:
+    from .image_store import ImageStore, response_validators, conditional_headers
+    from .image_probe import probe_dimensions
+    from .features import compute_features
+    from .thumbnails import make_derivative
+    from .credentials import KeyPool, RATE_LIMITED_STATUSES
+except ImportError:
+    from image_store import ImageStore, response_validators, conditional_headers
+    from image_probe import probe_dimensions
+    from features import compute_features
+    from thumbnails import make_derivative
+    from credentials import KeyPool, RATE_LIMITED_STATUSES
+
+
+IMAGE_NAME_PATTERN = re.compile(r"^apod_(\d{8})(_hd)?\.(jpg|jpeg|png|gif)$", re.IGNORECASE)
 
 
 class APODClient:
-    def __init__(self, api_key, apod_folder):
-        self.api_key = api_key
+    # Pick random images from the local catalog once it has this many
+    RANDOM_CATALOG_MINIMUM = 100
+
+    # Bounding box for standard-quality images derived from HD originals
+    STANDARD_MAX_SIZE = (1024, 1024)
+    IMAGE_FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG", ".gif": "GIF"}
+
+    # Random candidates to try before giving up
+    MAX_RANDOM_ATTEMPTS = 5
+
+    # Share of random picks that ignore the feature index, so new images keep arriving
+    RANDOM_EXPLORE_CHANCE = 0.25
+
+    # Automatic quality picks HD only if it should arrive within this many seconds
+    MAX_HD_SECONDS = 20
+    # Assumed HD size when the server doesn't say
+    TYPICAL_HD_BYTES = 4 * 1024 * 1024
+
+    # How long to wait for the API host and how long to trust the answer
+    REACHABILITY_TIMEOUT = 2
+    REACHABILITY_TTL = 60
+
+    DEFAULT_BASE_URL = "https://api.nasa.gov/planetary/apod"
+
+    def __init__(self, api_key, apod_folder, catalog=None, image_store=None, base_url=None, image_host=None):
+        """api_key is a single key or a list of keys to spread requests over"""
+        self.key_pool = KeyPool(api_key, os.path.join(apod_folder, "api_keys_state.json"))
         self.apod_folder = apod_folder
-        self.base_url = "https://api.nasa.gov/planetary/apod"
+        self.base_url = base_url or self.DEFAULT_BASE_URL
+        self.image_host = image_host
+        self.catalog = catalog
+        self.image_store = image_store or ImageStore(apod_folder)
+        self.image_filter = None
+        self.filter_daily_images = False
+        self.random_criteria = None
+        # Video days use the video's thumbnail, upscaled to this size if set
+        self.use_video_thumbnails = False
+        self.video_thumbnail_size = None
+        # Choose HD or standard per download from measured bandwidth and the screen
+        self.auto_quality = False
+        self.screen_size = None
+        self._reachability = (0, False)
+
+    def is_online(self, force=False):
+        """Quickly check if the API host is reachable
+
+        A plain TCP connect with a short timeout tells us within a couple of
+        seconds that we're offline, instead of waiting out request timeouts.
+        """
+        checked_at, online = self._reachability
+        if not force and time.monotonic() - checked_at < self.REACHABILITY_TTL:
+            return online
+
+        parsed = urlparse(self.base_url)
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        try:
+            socket.create_connection((parsed.hostname, port), timeout=self.REACHABILITY_TIMEOUT).close()
+            online = True
+        except OSError:
+            online = False
+
+        self._reachability = (time.monotonic(), online)
+        return online
     
     def get_apod_data(self, date=None, hd=True, random_date=False):
-        """Get APOD data from NASA API"""
-        url = f"{self.base_url}?api_key={self.api_key}"
+        """Get APOD data from the local catalog or the NASA API"""
+        query = ""
+
+        if random_date and self.catalog and self.random_criteria and random.random() >= self.RANDOM_EXPLORE_CHANCE:
+            # Answered from the feature index; matches are already on disk
+            dates = self.catalog.select_by_features(self.random_criteria, limit=1, random_order=True)
+            if dates:
+                return self._local_metadata(dates[0])
+
+        if random_date and self.catalog and self.catalog.count("image") >= self.RANDOM_CATALOG_MINIMUM:
+            entry = self.catalog.random_entry("image")
+            if entry:
+                return entry
         
         if random_date:
             # Generate a random date between APOD start date (1995-06-16) and today
@@ -27,53 +119,171 @@ class APODClient:
             random_date_obj = start_date + timedelta(days=random_days)
             date = random_date_obj.strftime("%Y-%m-%d")
         
+        if date and self.catalog:
+            entry = self.catalog.get(date)
+            if entry:
+                return entry
+
         if date:
-            url += f"&date={date}"
+            query += f"&date={date}"
         
         if hd:
-            url += "&hd=true"
+            query += "&hd=true"
+
+        # Video entries then come with a still image we can fall back to
+        query += "&thumbs=true"
         
         try:
-            response = requests.get(url, timeout=30)
+            response = self._api_get(query, timeout=30)
             response.raise_for_status()
-            return response.json()
+            data = response.json()
         except Exception as e:
             raise Exception(f"Failed to fetch APOD data: {e}")
+
+        if self.catalog:
+            self.catalog.add(data)
+            if data.get("date"):
+                self.catalog.set_validators(data["date"], response_validators(response), time.time())
+        return data
+
+    def _api_get(self, query, timeout, headers=None):
+        """GET the API with the key that has the most quota left
+
+        A key the API refuses is rested and the request retried with the
+        next one, trying each key at most once.
+        """
+        for _ in range(max(len(self.key_pool), 1)):
+            api_key = self.key_pool.acquire()
+            try:
+                response = requests.get(f"{self.base_url}?api_key={api_key}{query}", timeout=timeout, headers=headers)
+            except Exception:
+                self.key_pool.release(api_key)
+                raise
+            self.key_pool.report(api_key, response.status_code, response.headers)
+            if response.status_code not in RATE_LIMITED_STATUSES:
+                break
+        return response
+
+    def get_apod_range(self, start_date, end_date):
+        """Get APOD data for a date range in one request and catalog it"""
+        query = f"&start_date={start_date}&end_date={end_date}&thumbs=true"
+
+        try:
+            response = self._api_get(query, timeout=60)
+            response.raise_for_status()
+            entries = response.json()
+        except Exception as e:
+            raise Exception(f"Failed to fetch APOD range: {e}")
+
+        if self.catalog:
+            self.catalog.add_many(entries)
+        return entries
     
+    def get_cached_image(self, date, hd=True):
+        """Get the path of an already downloaded image for a date, if any"""
+        timestamp = date.replace("-", "")
+        quality_suffix = "_hd" if hd else ""
+        pattern = os.path.join(self.apod_folder, f"apod_{timestamp}{quality_suffix}.*")
+        for path in glob.glob(pattern):
+            if not path.endswith(".part"):
+                return path
+        return None
+
+    def find_local_image(self, date, hd=True):
+        """Get a local image for a date, deriving standard quality from HD"""
+        cached_path = self.get_cached_image(date, hd)
+        if cached_path or hd:
+            return cached_path
+
+        hd_path = self.get_cached_image(date, hd=True)
+        if not hd_path:
+            return None
+        try:
+            return self.derive_standard_image(hd_path)
+        except Exception as e:
+            print(f"Could not derive standard image from {hd_path}: {e}")
+            return None
+
+    def derive_standard_image(self, hd_path):
+        """Create the standard-quality variant of a cached HD image locally"""
+        from PIL import Image
+
+        ext = os.path.splitext(hd_path)[1]
+        image_format = self.IMAGE_FORMATS.get(ext.lower(), "PNG")
+        # Only the file name carries the quality suffix; the folder may contain "_hd" too
+        name = os.path.basename(hd_path)[:-len(ext)]
+        if name.endswith("_hd"):
+            name = name[:-len("_hd")]
+        image_path = os.path.join(os.path.dirname(hd_path), name + ext)
+        partial_path = os.path.join(self.image_store.blobs_folder, f"derive_{threading.get_ident()}.part")
+
+        with Image.open(hd_path) as image:
+            # JPEG can decode straight at 1/2, 1/4 or 1/8 scale, which is
+            # much faster than decoding the full image and shrinking it
+            image.draft("RGB", self.STANDARD_MAX_SIZE)
+            image.thumbnail(self.STANDARD_MAX_SIZE, Image.Resampling.LANCZOS)
+            if image_format == "JPEG" and image.mode != "RGB":
+                image = image.convert("RGB")
+            image.save(partial_path, image_format)
+
+        blob_path = self.image_store.add_file(partial_path, ext)
+        return self.image_store.link(blob_path, image_path)
+
     def download_image(self, date=None, silent=False, hd=True, random_date=False):
         """Download APOD image for a specific date"""
         try:
+            if not random_date:
+                # Serve from disk if this date was already downloaded (e.g. prefetched)
+                local_date = date or datetime.now().strftime("%Y-%m-%d")
+                cached_path = self._find_local_for_quality(local_date, hd)
+                if cached_path:
+                    if not silent:
+                        print(f"Using cached image {cached_path}")
+                    return cached_path, self._local_metadata(local_date)
+
             data = self.get_apod_data(date, hd, random_date)
             
             if data.get("media_type") != "image":
+                if self.use_video_thumbnails and data.get("thumbnail_url"):
+                    return self._download_video_thumbnail(data, self._timestamp_for(data, date, random_date), hd, silent)
                 if not silent:
                     print("APOD is not an image.")
                 return None
             
+            # A random pick may already be on disk, possibly only in HD
+            if random_date and data.get("date"):
+                cached_path = self._find_local_for_quality(data["date"], hd)
+                if cached_path:
+                    return cached_path, data
+
+            if self.auto_quality:
+                hd = self.choose_hd(data, silent)
+
             # Use HD URL if available and requested, otherwise use regular URL
             if hd and "hdurl" in data:
                 image_url = data["hdurl"]
             else:
                 image_url = data["url"]
+            image_url = self._resolve_image_url(image_url)
             
-            image_response = requests.get(image_url, timeout=60)
-            image_response.raise_for_status()
+            # Reject unsuitable images before spending the bandwidth on them
+            if (self.image_filter and (random_date or self.filter_daily_images)
+                    and not self.image_store.find_url(image_url)
+                    and not self._passes_filter(image_url, silent)):
+                return None
             
             # Generate filename
             ext = os.path.splitext(image_url)[1]
-            if date:
-                timestamp = date.replace("-", "")
-            elif random_date:
-                timestamp = data.get("date", datetime.now().strftime("%Y-%m-%d")).replace("-", "")
-            else:
-                timestamp = datetime.now().strftime("%Y%m%d")
+            timestamp = self._timestamp_for(data, date, random_date)
             
             quality_suffix = "_hd" if hd and "hdurl" in data else ""
             image_path = os.path.join(self.apod_folder, f"apod_{timestamp}{quality_suffix}{ext}")
             
-            # Save image
-            with open(image_path, "wb") as f:
-                f.write(image_response.content)
+            # Save image into the content-addressed store and link the dated
+            # name to it; the same bytes are never downloaded or stored twice
+            blob_path = self.image_store.fetch(image_url, timeout=60)
+            self.image_store.link(blob_path, image_path)
+            self.index_features(image_path, data.get("date") or date)
             
             if not silent:
                 print(f"Image downloaded to {image_path}")
@@ -85,6 +295,217 @@ class APODClient:
                 print(f"Error downloading APOD: {e}")
             return None
     
+    def _find_local_for_quality(self, date, hd):
+        """Find a local image for a date; automatic quality takes whichever is there"""
+        if self.auto_quality:
+            return self.get_cached_image(date, hd=True) or self.get_cached_image(date, hd=False)
+        return self.find_local_image(date, hd)
+
+    def choose_hd(self, data, silent=False):
+        """Decide whether HD is worth downloading on this connection and screen"""
+        if "hdurl" not in data:
+            return False
+
+        # Standard images already cover small screens
+        if self.screen_size and all(
+                screen <= limit for screen, limit in zip(self.screen_size, self.STANDARD_MAX_SIZE)):
+            return False
+
+        rate = self.image_store.bandwidth.estimate()
+        if rate is None:
+            # Nothing measured yet; this download becomes the first sample
+            return True
+
+        size = self._content_length(self._resolve_image_url(data["hdurl"])) or self.TYPICAL_HD_BYTES
+        expected_seconds = size / rate
+        if expected_seconds > self.MAX_HD_SECONDS and not silent:
+            print(f"Using standard quality: HD would take about {expected_seconds:.0f}s at {rate / 1024:.0f} KB/s")
+        return expected_seconds <= self.MAX_HD_SECONDS
+
+    def _content_length(self, url):
+        """Get a URL's size from a HEAD request, or None if unknown"""
+        try:
+            response = requests.head(url, timeout=self.REACHABILITY_TIMEOUT, allow_redirects=True)
+            return int(response.headers["Content-Length"]) if response.ok else None
+        except (requests.RequestException, KeyError, ValueError):
+            return None
+
+    def _timestamp_for(self, data, date, random_date):
+        """Get the YYYYMMDD used in the file name of a downloaded APOD"""
+        if date:
+            return date.replace("-", "")
+        if random_date:
+            return data.get("date", datetime.now().strftime("%Y-%m-%d")).replace("-", "")
+        return datetime.now().strftime("%Y%m%d")
+
+    def _download_video_thumbnail(self, data, timestamp, hd=True, silent=False):
+        """Use a video day's thumbnail as the wallpaper instead of falling back to another day
+
+        The thumbnail has a single quality, but is named with the requested
+        quality's suffix so the local lookups find it on later checks.
+        """
+        thumbnail_url = self._resolve_image_url(data["thumbnail_url"])
+        ext = os.path.splitext(urlparse(thumbnail_url).path)[1] or ".jpg"
+        blob_path = self.image_store.fetch(thumbnail_url, timeout=60)
+
+        if self.video_thumbnail_size:
+            # Thumbnails are small; scale up once here rather than leave it to Windows
+            partial_path = os.path.join(self.image_store.blobs_folder, f"upscale_{threading.get_ident()}.part")
+            make_derivative(blob_path, partial_path, self.video_thumbnail_size)
+            blob_path = self.image_store.add_file(partial_path, ".jpg")
+            ext = ".jpg"
+
+        quality_suffix = "_hd" if hd else ""
+        image_path = os.path.join(self.apod_folder, f"apod_{timestamp}{quality_suffix}{ext}")
+        self.image_store.link(blob_path, image_path)
+        self.index_features(image_path, data.get("date"))
+
+        if not silent:
+            print(f"APOD is a video, using its thumbnail {image_path}")
+        return image_path, data
+
+    def revalidate_entry(self, date):
+        """Check a cached date's metadata and images for corrections by NASA
+
+        Uses conditional GETs, so an unchanged entry costs a 304 with no
+        body. Returns True if the metadata or any local image changed.
+        """
+        old = self.catalog.get(date)
+        validators = self.catalog.get_validators(date)
+
+        response = self._api_get(f"&date={date}&hd=true&thumbs=true", timeout=30,
+                                 headers=conditional_headers(validators))
+        if response.status_code == 304:
+            self.catalog.set_validators(date, validators, time.time())
+            data = old
+            changed = False
+        else:
+            response.raise_for_status()
+            data = response.json()
+            changed = data != old
+            if changed:
+                self.catalog.add(data)
+            self.catalog.set_validators(date, response_validators(response), time.time())
+
+        if data and data.get("media_type") == "image":
+            changed = self._revalidate_images(date, data, old or {}) or changed
+        return changed
+
+    def _revalidate_images(self, date, data, old):
+        """Refresh local images of a date whose source changed"""
+        changed = False
+        for hd in (True, False):
+            image_path = self.get_cached_image(date, hd)
+            source = data.get("hdurl") if hd else data.get("url")
+            if not image_path or not source:
+                continue
+
+            image_url = self._resolve_image_url(source)
+            if self.image_store.find_url(image_url):
+                blob_path, blob_changed = self.image_store.revalidate(image_url)
+            elif source != (old.get("hdurl") if hd else old.get("url")):
+                # The entry now points at a different file altogether
+                blob_path, blob_changed = self.image_store.fetch(image_url), True
+            else:
+                # Derived locally from the HD image rather than downloaded
+                continue
+
+            if not blob_changed:
+                continue
+            self.image_store.link(blob_path, image_path)
+            self.index_features(image_path, date)
+            changed = True
+            print(f"Updated {image_path} from {image_url}")
+
+            # A standard image derived from the old HD one is out of date now
+            standard_path = self.get_cached_image(date, hd=False)
+            if hd and standard_path and not self.image_store.find_url(self._resolve_image_url(data.get("url", ""))):
+                os.remove(standard_path)
+        return changed
+
+    def revalidate_library(self, max_age_days=30, limit=20):
+        """Revalidate the least recently checked local images; returns how many changed"""
+        if not self.catalog:
+            return 0
+
+        dates = set()
+        for filename in os.listdir(self.apod_folder):
+            match = IMAGE_NAME_PATTERN.match(filename)
+            if match:
+                dates.add(datetime.strptime(match.group(1), "%Y%m%d").strftime("%Y-%m-%d"))
+
+        checked = self.catalog.validator_check_times()
+        cutoff = time.time() - max_age_days * 24 * 60 * 60
+        due = sorted((checked.get(date, 0), date) for date in dates if checked.get(date, 0) < cutoff)
+
+        changed = 0
+        for _, date in due[:limit]:
+            try:
+                if self.revalidate_entry(date):
+                    changed += 1
+            except Exception as e:
+                print(f"Could not revalidate {date}: {e}")
+        return changed
+
+    def index_features(self, image_path, date):
+        """Add a local image to the feature index unless it's already current"""
+        if not self.catalog:
+            return
+        try:
+            mtime = os.path.getmtime(image_path)
+            indexed = self.catalog.get_features(image_path)
+            if indexed and indexed["mtime"] == mtime:
+                return
+            features = compute_features(image_path)
+            self.catalog.add_features_many([dict(features, path=image_path, date=date, mtime=mtime)])
+        except Exception as e:
+            print(f"Could not index features of {image_path}: {e}")
+
+    def _resolve_image_url(self, url):
+        """Route an image URL through the configured image host, if any"""
+        if not self.image_host or url.startswith(self.image_host):
+            return url
+        parsed = urlparse(url)
+        return f"{self.image_host.rstrip('/')}/{parsed.hostname}{parsed.path}"
+
+    def _passes_filter(self, image_url, silent=False):
+        """Probe an image's header and check it against the image filter"""
+        try:
+            dimensions = probe_dimensions(image_url)
+        except Exception as e:
+            if not silent:
+                print(f"Could not probe {image_url}: {e}")
+            return True
+
+        # Unknown formats and odd headers are given the benefit of the doubt
+        if dimensions is None or self.image_filter.accepts(*dimensions):
+            return True
+        if not silent:
+            print(f"Skipping {image_url}: {dimensions[0]}x{dimensions[1]} is not a good wallpaper size")
+        return False
+
+    def find_latest_local_image(self, hd=True):
+        """Get the most recent downloaded image, preferring the given quality"""
+        best = None
+        for filename in os.listdir(self.apod_folder):
+            match = IMAGE_NAME_PATTERN.match(filename)
+            if not match:
+                continue
+            key = (match.group(1), bool(match.group(2)) == hd)
+            if best is None or key > best[0]:
+                best = (key, filename)
+
+        if best is None:
+            return None
+        date = datetime.strptime(best[0][0], "%Y%m%d").strftime("%Y-%m-%d")
+        metadata = dict(self._local_metadata(date), offline=True)
+        return os.path.join(self.apod_folder, best[1]), metadata
+
+    def _local_metadata(self, date):
+        """Get metadata for a locally available image without the API"""
+        entry = self.catalog.get(date) if self.catalog else None
+        return entry or {"date": date, "media_type": "image"}
+
     def get_yesterday_date(self):
         """Get yesterday's date in YYYY-MM-DD format"""
         return (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
@@ -92,6 +513,12 @@ class APODClient:
     def download_with_fallback(self, silent=False, hd=True, random_date=False):
         """Download today's APOD, fallback to yesterday if it's a video"""
         result = self.download_image(silent=silent, hd=hd, random_date=random_date)
+
+        # Random mode just moves on to another candidate (video, too small, ...)
+        attempts = 1
+        while result is None and random_date and attempts < self.MAX_RANDOM_ATTEMPTS:
+            result = self.download_image(silent=silent, hd=hd, random_date=True)
+            attempts += 1
         
         if result is None and not random_date:
             # Try yesterday's image (only if not using random date)
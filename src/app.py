@@ -7,32 +7,77 @@ import customtkinter as ctk
 from PIL import Image, ImageTk
 import io
 import os
+import queue
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 try:
     from .config import Config
     from .apod_client import APODClient
     from .wallpaper import WallpaperManager
-    from .gui import APIKeyDialog, UnsupportedOSWindow, WindowUtils, show_info
+    from .gui import APIKeyDialog, UnsupportedOSWindow, WindowUtils, CatalogSearchDialog, show_toast
     from .system_tray import SystemTray
     from .scheduler import Scheduler
+    from .notifications import NotificationQueue, merge as merge_notifications
+    from .update_coordinator import UpdateCoordinator, UpdateQueueFull
+    from .prefetcher import Prefetcher
+    from .rotation import RotationManager
+    from .catalog import Catalog
+    from .image_store import ImageStore
+    from .image_probe import ImageFilter
+    from .memory import MemoryManager
+    from .history import WallpaperHistory
+    from .config_watcher import ConfigWatcher
+    from .profiling import Profiler, requested_by_environment
 except:
     from config import Config
     from apod_client import APODClient
     from wallpaper import WallpaperManager
-    from gui import APIKeyDialog, UnsupportedOSWindow, WindowUtils, show_info
+    from gui import APIKeyDialog, UnsupportedOSWindow, WindowUtils, CatalogSearchDialog, show_toast
     from system_tray import SystemTray
     from scheduler import Scheduler
+    from notifications import NotificationQueue, merge as merge_notifications
+    from update_coordinator import UpdateCoordinator, UpdateQueueFull
+    from prefetcher import Prefetcher
+    from rotation import RotationManager
+    from catalog import Catalog
+    from image_store import ImageStore
+    from image_probe import ImageFilter
+    from memory import MemoryManager
+    from history import WallpaperHistory
+    from config_watcher import ConfigWatcher
+    from profiling import Profiler, requested_by_environment
 
 
 class APODPaperApp:
-    def __init__(self, root):
+    NOTIFICATION_POLL_MS = 250
+
+    def __init__(self, root, instance=None):
         self.root = root
+        self.instance = instance
         self.config = Config()
+        self.catalog = Catalog(self.config.catalog_path)
+        self.image_store = ImageStore(self.config.apod_folder)
         self.wallpaper_manager = WallpaperManager()
         self.apod_client = None
         self.system_tray = SystemTray(self)
         self.scheduler = Scheduler(self)
+        self.notifications = NotificationQueue()
+        self.profiler = Profiler(self.config.apod_folder)
+        if requested_by_environment() or self.config.get_profiling_enabled():
+            self.profiler.enable()
+        self.update_coordinator = UpdateCoordinator(self.profiler.wrap(self._perform_update, "update"))
+        self.prefetcher = Prefetcher(self)
+        self.rotation = RotationManager(self)
+        self.memory = MemoryManager(self)
+        self.history = WallpaperHistory(self.config.apod_folder)
+        self.config_watcher = ConfigWatcher(self.config)
+        self._watch_config()
         self.api_key = None
+        self._toast = None
+        self._stale = False
+        self._offline_image_path = None
+        # Callables from other threads that must run on the Tk thread
+        self._ui_calls = queue.Queue()
     
     def initialize(self):
         """Initialize the application"""
@@ -47,10 +92,72 @@ class APODPaperApp:
             return False
         
         # Initialize APOD client
-        self.apod_client = APODClient(self.api_key, self.config.apod_folder)
+        self.apod_client = self._create_apod_client()
         
         return True
     
+    def _create_apod_client(self):
+        """Create an APOD client for the current API key and settings"""
+        client = APODClient(self.config.get_api_keys(), self.config.apod_folder, self.catalog, self.image_store)
+        self._configure_apod_client(client)
+        return client
+
+    def _configure_apod_client(self, client):
+        """Apply the endpoint and image selection settings to a client"""
+        client.base_url = self.config.get_api_base_url() or APODClient.DEFAULT_BASE_URL
+        client.image_host = self.config.get_image_host()
+        client.image_filter = ImageFilter(**self.config.get_image_filter_settings())
+        client.filter_daily_images = self.config.get_filter_daily_images()
+        client.random_criteria = self.config.get_random_criteria()
+        video_thumbnails = self.config.get_video_thumbnail_settings()
+        client.use_video_thumbnails = video_thumbnails["enabled"]
+        client.video_thumbnail_size = self.wallpaper_manager.get_screen_size() if video_thumbnails["upscale"] else None
+        client.auto_quality = self.config.get_auto_quality()
+        client.screen_size = self.wallpaper_manager.get_screen_size()
+        self.image_store.set_rate_limit(self.config.get_download_rate_limit())
+
+    def _watch_config(self):
+        """Apply config.json changes to just the parts they affect"""
+        watcher = self.config_watcher
+        watcher.on_change({"NASA_API_KEY", "NASA_API_KEYS"}, self._on_api_key_changed)
+        watcher.on_change({"auto_update", "update_frequency"}, lambda changed: self.scheduler.schedule_updates())
+        watcher.on_change({"profiling"}, lambda changed: self.profiler.set_enabled(self.config.get_profiling_enabled()))
+        watcher.on_change(
+            {"rotation_enabled", "rotation_interval_minutes", "rotation_order",
+             "rotation_start_date", "rotation_end_date"},
+            self._on_rotation_changed
+        )
+        watcher.on_change(
+            {"api_base_url", "image_host", "min_image_width", "min_image_height", "min_aspect_ratio",
+             "max_aspect_ratio", "filter_daily_images", "random_criteria",
+             "video_thumbnails", "upscale_video_thumbnails", "image_quality",
+             "max_download_kb_per_second"},
+            lambda changed: self.apod_client and self._configure_apod_client(self.apod_client)
+        )
+
+    def toggle_profiling(self, icon=None, item=None):
+        """Switch CPU and memory profiling on or off for this session"""
+        enabled = not self.profiler.enabled
+        self.profiler.set_enabled(enabled)
+        status = "enabled" if enabled else "disabled"
+        self.notify("Profiling", f"Profiling {status}. Reports are saved in {self.profiler.folder}", "gear")
+
+    def debug_menu_visible(self):
+        """Check if the hidden diagnostics menu items should be shown"""
+        return self.profiler.enabled or requested_by_environment() or self.config.get_debug_menu()
+
+    def _on_api_key_changed(self, changed):
+        """Swap the keys in the live client, keeping its state"""
+        api_key = self.config.get_api_key()
+        if self.config.is_valid_api_key(api_key):
+            self.api_key = api_key
+        if self.apod_client is not None:
+            self.apod_client.key_pool.set_keys(self.config.get_api_keys())
+
+    def _on_rotation_changed(self, changed):
+        self.rotation.invalidate()
+        self.scheduler.schedule_rotation()
+    
     def get_or_prompt_api_key(self):
         """Get API key from config or prompt user"""
         api_key = self.config.get_api_key()
@@ -72,55 +179,212 @@ class APODPaperApp:
         
         # Only update if we haven't updated today
         if last_update != today:
-            hd_enabled = self.config.get_hd_preference()
-            random_enabled = self.config.get_random_image_preference()
-            
-            result = self.apod_client.download_with_fallback(silent=True, hd=hd_enabled, random_date=random_enabled)
+            try:
+                result = self._request_update().result()
+            except Exception as e:
+                print(f"Automatic update failed: {e}")
+                return False
+
             if result:
-                image_path, apod_data = result
-                if self.wallpaper_manager.set_wallpaper(image_path):
-                    self.config.update_last_update()
-                    print(f"Wallpaper automatically updated at {datetime.now()}")
-                    return True
+                print(f"Wallpaper automatically updated at {datetime.now()}")
+                return True
         
         return False
     
     def manual_update(self, icon=None, item=None):
         """Manually update wallpaper"""
-        def do_update():
-            try:
-                hd_enabled = self.config.get_hd_preference()
-                random_enabled = self.config.get_random_image_preference()
-                
-                result = self.apod_client.download_with_fallback(hd=hd_enabled, random_date=random_enabled)
-                if result:
-                    image_path, apod_data = result
-                    if self.wallpaper_manager.set_wallpaper(image_path):
-                        self.config.update_last_update()
-                        # Schedule dialog creation on main thread
-                        self.root.after(0, lambda: self._show_success_dialog("Successfully updated wallpaper!"))
-                    else:
-                        self.root.after(0, lambda: self._show_error_dialog("Could not update", "Failed to update wallpaper :("))
-                else:
-                    self.root.after(0, lambda: self._show_warning_dialog("Could not download image", "Failed to download image. Perhaps your API key is wrong?"))
-            except Exception as e:
-                self.root.after(0, lambda: self._show_error_dialog("Unknown Error", f"We encountered an unknown error updating the APOD \n {e} \n Please create an issue on GitHub!"))
-        
-        # Run the update in a separate thread to avoid blocking the UI
-        import threading
-        threading.Thread(target=do_update, daemon=True).start()
+        # The coordinator runs the update off the UI thread and folds
+        # repeated clicks into the update that is already running
+        self._request_update().add_done_callback(self._on_manual_update_done)
+
+    def _request_update(self, hd=None, random_date=None):
+        """Submit an update to the coordinator, defaulting to the current preferences"""
+        random_enabled = self.config.get_random_image_preference() if random_date is None else random_date
+        future = self.update_coordinator.submit(
+            hd=self.config.get_hd_preference() if hd is None else hd,
+            random_date=random_enabled
+        )
+        # Downloads and decodes leave large buffers behind; hand them back
+        future.add_done_callback(lambda f: self.memory.trim("an update", idle=True))
+
+        # Get the next random candidate ready once this update is done
+        if random_enabled:
+            future.add_done_callback(lambda f: self.prefetcher.request_prefetch())
+        return future
+
+    def set_wallpaper_from_date(self, date, hd=None):
+        """Set the wallpaper to the APOD of a specific date"""
+        future = self.update_coordinator.submit(
+            hd=self.config.get_hd_preference() if hd is None else hd,
+            random_date=False,
+            date=date
+        )
+        future.add_done_callback(lambda f: self.memory.trim("an update", idle=True))
+        future.add_done_callback(self._on_manual_update_done)
+        return future
+
+    def _perform_update(self, hd, random_date, date=None):
+        """Download and apply a wallpaper; runs on the coordinator thread
+
+        Returns the download result on success, False if the wallpaper
+        could not be set and None if nothing could be downloaded.
+        """
+        if not date and not self.apod_client.is_online():
+            return self._apply_offline_image(hd)
+
+        result = None
+        if date:
+            result = self.apod_client.download_image(date, hd=hd)
+        elif random_date:
+            result = self.prefetcher.take_random(hd)
+        if not result and not date:
+            result = self.apod_client.download_with_fallback(hd=hd, random_date=random_date)
+        if not result:
+            return None
+
+        image_path, apod_data = result
+        source = "date" if date else "random" if random_date else "daily"
+        if not self.apply_wallpaper(image_path, apod_data.get("date"), source):
+            return False
+
+        # A specifically chosen date doesn't count as today's update
+        if not date:
+            self.config.update_last_update()
+            self._stale = False
+        return result
+
+    def apply_wallpaper(self, image_path, date=None, source="daily"):
+        """Set a local image as wallpaper and remember it in the history"""
+        if not self.wallpaper_manager.set_wallpaper(image_path):
+            return False
+        self.history.record(image_path, date, source)
+        return True
+
+    def previous_wallpaper(self, icon=None, item=None):
+        """Go back to the previous wallpaper from local files"""
+        self._step_history(self.history.previous, "There is no earlier wallpaper in the history.")
+
+    def next_wallpaper(self, icon=None, item=None):
+        """Go forward again after going back"""
+        self._step_history(self.history.next, "This is already the latest wallpaper.")
+
+    def _step_history(self, step, end_message):
+        entry = step()
+        if entry is None:
+            self.notify("History", end_message, "info")
+        elif not self.wallpaper_manager.set_wallpaper(entry["path"]):
+            self.notify("Could not update", "Failed to update wallpaper :(", "error")
+
+    def _apply_offline_image(self, hd):
+        """Show the best cached image while offline and revalidate later"""
+        self._stale = True
+        result = self.apod_client.find_latest_local_image(hd)
+        if not result:
+            return None
+
+        image_path, apod_data = result
+        if image_path != self._offline_image_path:
+            if not self.apply_wallpaper(image_path, apod_data.get("date"), "offline"):
+                return False
+            self._offline_image_path = image_path
+        return result
+
+    def revalidate_if_stale(self):
+        """Run the real update once connectivity returns after being offline"""
+        if not self._stale or self.apod_client is None:
+            return
+        if self.apod_client.is_online(force=True):
+            print("Back online, updating wallpaper")
+            # Cleared here, since the update may be skipped (auto-update off, already
+            # updated today); an update that finds us offline again sets it back
+            self._stale = False
+            self._offline_image_path = None
+            self.check_and_update_wallpaper()
+
+    def _on_manual_update_done(self, future):
+        """Report the outcome of a manual update"""
+        try:
+            result = future.result()
+        except UpdateQueueFull:
+            self.notify("Please wait", "An update is already in progress.", "warning")
+            return
+        except Exception as e:
+            self.notify("Unknown Error", f"We encountered an unknown error updating the APOD \n {e} \n Please create an issue on GitHub!", "error")
+            return
+
+        if result and result[1].get("offline"):
+            self.notify("Offline", "No connection right now, showing your latest saved image. We'll update once you're back online.", "warning")
+        elif result:
+            self.notify("Success", "Successfully updated wallpaper!", "success")
+        elif result is False:
+            self.notify("Could not update", "Failed to update wallpaper :(", "error")
+        else:
+            self.notify("Could not download image", "Failed to download image. Perhaps your API key is wrong?", "warning")
     
+    # Longest a forwarded update waits for its result before replying
+    REMOTE_UPDATE_TIMEOUT = 180
+
+    def handle_remote_command(self, command, args):
+        """Handle a command forwarded by a second launch or the CLI
+
+        Runs on the instance server thread; UI work is handed to the Tk loop.
+        """
+        if command == "settings":
+            self._ui_calls.put(self.show_settings)
+            return {"ok": True}
+        if command == "status":
+            return {"ok": True, "status": self.get_status()}
+        if command != "update":
+            return {"ok": False, "reason": "error", "error": f"Unknown command: {command}"}
+
+        if args.get("date"):
+            future = self.set_wallpaper_from_date(args["date"], hd=args.get("hd"))
+        else:
+            future = self._request_update(hd=args.get("hd"), random_date=args.get("random_date"))
+            future.add_done_callback(self._on_manual_update_done)
+
+        try:
+            result = future.result(timeout=self.REMOTE_UPDATE_TIMEOUT)
+        except UpdateQueueFull:
+            return {"ok": False, "reason": "busy", "error": "An update is already in progress"}
+        except FutureTimeoutError:
+            return {"ok": False, "reason": "busy", "error": "The update is still running"}
+        except Exception as e:
+            return {"ok": False, "reason": "error", "error": str(e)}
+
+        if result is False:
+            return {"ok": False, "reason": "wallpaper_failed", "error": "Failed to set wallpaper"}
+        if not result:
+            return {"ok": False, "reason": "download_failed", "error": "Failed to download image"}
+        image_path, apod_data = result
+        return {
+            "ok": True,
+            "path": image_path,
+            "date": apod_data.get("date"),
+            "title": apod_data.get("title", ""),
+            "offline": bool(apod_data.get("offline"))
+        }
+
+    def get_status(self):
+        """Get a summary of what the running app is doing"""
+        config_data = self.config.get_config()
+        return {
+            "pid": os.getpid(),
+            "last_update": config_data.get("last_update") or "never",
+            "auto_update": config_data.get("auto_update", True),
+            "updating": self.update_coordinator.is_busy(),
+            "offline": self._stale,
+            "memory": self.memory.describe()
+        }
+
     def toggle_auto_update(self, icon=None, item=None):
         """Toggle automatic updates on/off"""
         auto_update_enabled = self.config.toggle_auto_update()
         status = "enabled" if auto_update_enabled else "disabled"
-        show_info(self.root, "Settings", f"Auto-update {status}", "gear")
-        
-        # Restart scheduler with new settings
-        if auto_update_enabled:
-            self.scheduler.start()
-        else:
-            self.scheduler.stop()
+        self.notify("Settings", f"Auto-update {status}", "gear")
+
+        # Reschedules only the update jobs; prefetching and the rest keep running
+        self.config_watcher.check()
     
     def show_settings(self, icon=None, item=None):
         """Show settings window"""
@@ -130,6 +394,7 @@ class APODPaperApp:
         settings_dialog.geometry("500x600")
         settings_dialog.resizable(False, False)
         WindowUtils.set_window_icon(settings_dialog)
+        self.memory.trim_after_close(settings_dialog)
 
         # Apply dark theme
         settings_dialog.configure(fg_color=Theme.SPACE_BLACK)
@@ -185,9 +450,8 @@ class APODPaperApp:
             if new_key:
                 masked_key = f"{new_key[:8]}...{new_key[-4:]}" if len(new_key) > 12 else "DEMO_KEY"
                 api_display.configure(text=masked_key)
-                # Reinitialize APOD client with new key
-                self.api_key = new_key
-                self.apod_client = APODClient(self.api_key, self.config.apod_folder)
+                # The live client picks up the new key
+                self.config_watcher.check()
 
         api_button = ctk.CTkButton(
             api_section,
@@ -283,18 +547,17 @@ class APODPaperApp:
             new_auto = auto_switch.get() == 1
             if current_auto != new_auto:
                 self.config.toggle_auto_update()
-                if new_auto:
-                    self.scheduler.start()
-                else:
-                    self.scheduler.stop()
             
             # Save HD preference
             self.config.set_hd_preference(hd_switch.get() == 1)
             
             # Save random preference
             self.config.set_random_image_preference(random_switch.get() == 1)
+
+            # Apply whatever changed without restarting anything
+            self.config_watcher.check()
             
-            show_info(self.root, "Settings", "Settings saved successfully!", "gear")
+            self.notify("Settings", "Settings saved successfully!", "gear")
             settings_dialog.destroy()
 
         def cancel_settings():
@@ -332,6 +595,16 @@ class APODPaperApp:
         settings_dialog.focus_set()
         settings_dialog.lift()
 
+    def show_catalog_search(self, icon=None, item=None):
+        """Show the catalog search window"""
+        dialog = CatalogSearchDialog(self.catalog, self.root, self.set_wallpaper_from_date)
+        self.memory.trim_after_close(dialog.show())
+
+    def show_gallery(self, icon=None, item=None):
+        """Show the thumbnail gallery of the local library"""
+        from src.gallery import GalleryWindow
+        self.memory.trim_after_close(GalleryWindow(self).show())
+
     def show_about(self, icon=None, item=None):
         """Show about dialog"""
         from src.gui import WindowUtils, Theme
@@ -340,6 +613,7 @@ class APODPaperApp:
         about_dialog.geometry("400x500")
         about_dialog.resizable(False, False)
         WindowUtils.set_window_icon(about_dialog)
+        self.memory.trim_after_close(about_dialog)
 
         # Apply dark theme
         about_dialog.configure(fg_color=Theme.SPACE_BLACK)
@@ -347,7 +621,7 @@ class APODPaperApp:
         # Text content
         text_label = ctk.CTkLabel(
             about_dialog,
-            text="APODPaper v1.1.0\n\nNASA Astronomy Picture of the Day\nWallpaper Application",
+            text=f"APODPaper v1.1.0\n\nNASA Astronomy Picture of the Day\nWallpaper Application\n\n{self.memory.describe()}",
             font=ctk.CTkFont(size=14),
             text_color=Theme.TEXT
         )
@@ -399,69 +673,84 @@ class APODPaperApp:
         if not self.initialize():
             return
 
+        # Ready for commands from later launches and the CLI
+        if self.instance is not None:
+            self.instance.serve(self.handle_remote_command)
+
         # Initial wallpaper check
         self.check_and_update_wallpaper()
 
         # Start scheduler
         self.scheduler.start()
 
+        # Pick up config.json edits made by hand or by deployment tools
+        self.config_watcher.start()
+
+        # Show notifications posted by worker threads from the Tk loop
+        self.root.after(self.NOTIFICATION_POLL_MS, self._drain_notifications)
+
         # Set up and run system tray in a background thread
         tray_icon = self.system_tray.setup()
         tray_thread = threading.Thread(target=tray_icon.run, daemon=True)
         tray_thread.start()
     
+    def quit_app(self, icon=None, item=None):
+        """Stop background work, give up the single-instance lock and exit"""
+        self.scheduler.stop()
+        self.config_watcher.stop()
+        # Later launches and CLI runs must not find a stale instance.json
+        if self.instance is not None:
+            self.instance.release()
+        self.system_tray.quit_app()
+        # Ends root.mainloop() from the Tk thread
+        self._ui_calls.put(self.root.quit)
+
     def clean_folder(self):
         """
         Delete all saved image files to save storage
         """
-        local_app_data_path = os.getenv("LOCALAPPDATA")
-        path = os.path.join(local_app_data_path, "apodpaper")
-        extensions = ["png", "jpg", "jpeg", "gif"]
-
-        for filename in os.listdir(path):
-            ext = filename.split(".")[1]
-            if ext in extensions:
-                filepath = os.path.join(path, filename)
-                try:
-                    os.remove(filepath)
-                    print(f"removed {filepath}")
-                except OSError as e:
-                    print(f"error removing file {filepath}: {e}")
-
-    def _show_success_dialog(self, message):
-        """Show success dialog on main thread"""
-        dialog = show_info(self._get_dialog_parent(), "Success", message, "success")
-        # Keep dialog open by forcing focus and waiting
-        self._ensure_dialog_stays_open(dialog)
-
-    def _show_error_dialog(self, title, message):
-        """Show error dialog on main thread"""
-        dialog = show_info(self._get_dialog_parent(), title, message, "error")
-        self._ensure_dialog_stays_open(dialog)
-
-    def _show_warning_dialog(self, title, message):
-        """Show warning dialog on main thread"""
-        dialog = show_info(self._get_dialog_parent(), title, message, "warning")
-        self._ensure_dialog_stays_open(dialog)
-
-    def _get_dialog_parent(self):
-        """Get appropriate parent for dialogs"""
-        # Always use root as parent - it should be available even if withdrawn
-        return self.root
-
-    def _ensure_dialog_stays_open(self, dialog):
-        """Ensure dialog stays open and is properly focused"""
-        dialog.attributes("-topmost", True)
-        dialog.lift()
-        dialog.focus_force()
-        # Make sure dialog doesn't get destroyed immediately
-        dialog.grab_set()
-        dialog.wait_window()
-
-
-def main(root):
-    """Entry point for the application"""
-    app = APODPaperApp(root)
+        removed = self.image_store.clean_library()
+        self.catalog.clear_features()
+        self.rotation.discard()
+
+        self.notify("Clean Up", f"Removed {removed} saved image(s)", "success")
+
+    def notify(self, title, message, icon_type="info"):
+        """Queue a notification; safe to call from any thread"""
+        self.notifications.post(title, message, icon_type)
+
+    def _drain_notifications(self):
+        """Show queued notifications and run queued UI calls without blocking the Tk loop"""
+        try:
+            while not self._ui_calls.empty():
+                self._ui_calls.get_nowait()()
+            notifications = self.notifications.drain()
+            if notifications:
+                # One toast for everything drained together, so none is lost
+                self._show_notification(*merge_notifications(notifications))
+        except Exception as e:
+            print(f"Failed to show notification: {e}")
+        finally:
+            self.root.after(self.NOTIFICATION_POLL_MS, self._drain_notifications)
+
+    def _show_notification(self, title, message, icon_type):
+        """Show a single notification as a tray balloon or toast"""
+        if self.config.get_notification_style() == "tray" and self.system_tray.notify(title, message):
+            return
+
+        # Replace the current toast so back-to-back results don't stack up
+        if self._toast is not None and self._toast.winfo_exists():
+            self._toast.destroy()
+        self._toast = show_toast(self.root, title, message, icon_type)
+
+
+def main(root, instance=None):
+    """Entry point for the application
+
+    instance is the SingleInstance lock held by this process; when given,
+    commands from later launches are accepted on it.
+    """
+    app = APODPaperApp(root, instance)
     app.run()
     root.mainloop()
 
@@ -0,0 +1,56 @@
+"""
+Download throughput estimation and rate limiting
+"""
+import time
+import threading
+
+
+class BandwidthEstimator:
+    # Weight of the newest sample in the moving average
+    SMOOTHING = 0.3
+
+    # Smaller transfers are dominated by latency and say little about bandwidth
+    MIN_SAMPLE_BYTES = 256 * 1024
+
+    def __init__(self, initial=None):
+        self._lock = threading.Lock()
+        self._estimate = initial
+
+    def add_sample(self, byte_count, seconds):
+        """Fold a finished transfer into the estimate"""
+        if byte_count < self.MIN_SAMPLE_BYTES or seconds <= 0:
+            return
+        rate = byte_count / seconds
+        with self._lock:
+            if self._estimate is None:
+                self._estimate = rate
+            else:
+                self._estimate += self.SMOOTHING * (rate - self._estimate)
+
+    def estimate(self):
+        """Get the expected throughput in bytes per second, or None before any sample"""
+        with self._lock:
+            return self._estimate
+
+
+class TokenBucket:
+    """Limits the combined rate of every thread that consumes from it"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, byte_count):
+        """Wait until byte_count bytes fit within the rate"""
+        with self._lock:
+            now = time.monotonic()
+            # Allow up to one second of burst
+            self._tokens = min(self._tokens + (now - self._updated) * self.rate, self.rate)
+            self._updated = now
+            # Going into debt lets chunks larger than the bucket through, just later
+            self._tokens -= byte_count
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
@@ -0,0 +1,161 @@
+"""
+Library-wide image processing on a process pool
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+try:
+    from .thumbnails import ThumbnailCache, make_thumbnail, make_derivative, derivative_path_for
+    from .features import compute_features
+except ImportError:
+    from thumbnails import ThumbnailCache, make_thumbnail, make_derivative, derivative_path_for
+    from features import compute_features
+
+
+BELOW_NORMAL_PRIORITY_CLASS = 0x4000
+
+
+def lower_process_priority():
+    """Run the current process below normal priority so the desktop stays responsive"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), BELOW_NORMAL_PRIORITY_CLASS)
+        else:
+            os.nice(10)
+    except Exception as e:
+        print(f"Could not lower process priority: {e}")
+
+
+def process_image(job):
+    """Process one image: hash, features, thumbnail and derivative
+
+    Runs in a worker process, so it only takes and returns plain data.
+    """
+    path = job["path"]
+    result = {"path": path}
+    try:
+        # Inside the try: the image may have been deleted or renamed since it was listed
+        result["mtime"] = os.path.getmtime(path)
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        result["sha256"] = hasher.hexdigest()
+
+        # Measured on a reduced-size decode, which also gives the full dimensions
+        result["features"] = compute_features(path)
+        result["width"] = result["features"]["width"]
+        result["height"] = result["features"]["height"]
+
+        if job.get("thumbnail_path") and not os.path.exists(job["thumbnail_path"]):
+            make_thumbnail(path, job["thumbnail_path"])
+        if job.get("derivative_path") and not os.path.exists(job["derivative_path"]):
+            make_derivative(path, job["derivative_path"], tuple(job["derivative_size"]))
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+class BulkProcessor:
+    # Write the checkpoint after this many finished images
+    CHECKPOINT_EVERY = 50
+
+    def __init__(self, apod_folder, workers=None, low_priority=True):
+        self.apod_folder = apod_folder
+        self.workers = workers or max((os.cpu_count() or 2) - 1, 1)
+        self.low_priority = low_priority
+        self.checkpoint_path = os.path.join(apod_folder, "bulk_checkpoint.json")
+        self.thumbnails = ThumbnailCache(apod_folder)
+        self.derivatives_folder = os.path.join(apod_folder, "derivatives")
+        self.checkpoint = self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        """Load per-image results from earlier (possibly interrupted) runs"""
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_checkpoint(self):
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.checkpoint, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def build_jobs(self, paths, thumbnails=True, derivative_size=None):
+        """Make jobs for images that changed or weren't processed yet"""
+        jobs = []
+        for path in paths:
+            done = self.checkpoint.get(os.path.basename(path))
+            # Results from before the feature index existed are redone to fill it
+            if (done and "error" not in done and "features" in done
+                    and done.get("mtime") == os.path.getmtime(path)):
+                continue
+
+            job = {"path": path}
+            if thumbnails:
+                job["thumbnail_path"] = self.thumbnails.path_for(path)
+            if derivative_size:
+                job["derivative_path"] = derivative_path_for(self.derivatives_folder, path, derivative_size)
+                job["derivative_size"] = list(derivative_size)
+            jobs.append(job)
+        return jobs
+
+    def run(self, paths, thumbnails=True, derivative_size=None, progress=None):
+        """Process images across worker processes, resuming from the checkpoint
+
+        progress(done, total, images_per_second) is called as results come in.
+        Returns (processed, failed).
+        """
+        jobs = self.build_jobs(paths, thumbnails, derivative_size)
+        total = len(jobs)
+        if not jobs:
+            return 0, 0
+
+        os.makedirs(self.derivatives_folder, exist_ok=True)
+
+        initializer = lower_process_priority if self.low_priority else None
+        processed = failed = 0
+        started = time.monotonic()
+        pending_jobs = iter(jobs)
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=initializer) as executor:
+            # Keep a bounded window of jobs in flight instead of queuing everything
+            in_flight = set()
+            for job in pending_jobs:
+                in_flight.add(executor.submit(process_image, job))
+                if len(in_flight) >= self.workers * 4:
+                    break
+
+            try:
+                while in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        result = future.result()
+                        self.checkpoint[os.path.basename(result["path"])] = result
+                        processed += 1
+                        if "error" in result:
+                            failed += 1
+                            print(f"Failed to process {result['path']}: {result['error']}")
+
+                        next_job = next(pending_jobs, None)
+                        if next_job is not None:
+                            in_flight.add(executor.submit(process_image, next_job))
+
+                    if processed % self.CHECKPOINT_EVERY < len(finished):
+                        self._save_checkpoint()
+                    if progress:
+                        elapsed = max(time.monotonic() - started, 1e-6)
+                        progress(processed, total, processed / elapsed)
+            finally:
+                # Keep what finished so an interrupted run resumes where it stopped
+                self._save_checkpoint()
+
+        return processed, failed
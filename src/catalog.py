@@ -0,0 +1,336 @@
+"""
+Local searchable catalog of APOD metadata, stored in SQLite
+"""
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+try:
+    from .features import ORIENTATIONS
+except ImportError:
+    from features import ORIENTATIONS
+
+
+class Catalog:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self.has_fts = False
+        self._create_schema()
+
+    def _create_schema(self):
+        """Create tables, indexes and the full-text index if missing"""
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    date TEXT PRIMARY KEY,
+                    title TEXT,
+                    explanation TEXT,
+                    copyright TEXT,
+                    media_type TEXT,
+                    url TEXT,
+                    hdurl TEXT,
+                    data TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_media_type ON entries (media_type, date)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS features (
+                    path TEXT PRIMARY KEY,
+                    date TEXT NOT NULL,
+                    width INTEGER,
+                    height INTEGER,
+                    aspect REAL,
+                    brightness REAL,
+                    dark_fraction REAL,
+                    dominant_color TEXT,
+                    mtime REAL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS features_aspect ON features (aspect, width)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS validators (
+                    date TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    checked_at REAL NOT NULL
+                )
+            """)
+
+            try:
+                self._conn.execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+                        title, explanation, copyright,
+                        content='entries', content_rowid='rowid'
+                    )
+                """)
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5; search falls back to LIKE
+                return
+
+            self._conn.executescript("""
+                CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+                    INSERT INTO entries_fts (rowid, title, explanation, copyright)
+                    VALUES (new.rowid, new.title, new.explanation, new.copyright);
+                END;
+                CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+                    INSERT INTO entries_fts (entries_fts, rowid, title, explanation, copyright)
+                    VALUES ('delete', old.rowid, old.title, old.explanation, old.copyright);
+                END;
+                CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE ON entries BEGIN
+                    INSERT INTO entries_fts (entries_fts, rowid, title, explanation, copyright)
+                    VALUES ('delete', old.rowid, old.title, old.explanation, old.copyright);
+                    INSERT INTO entries_fts (rowid, title, explanation, copyright)
+                    VALUES (new.rowid, new.title, new.explanation, new.copyright);
+                END;
+            """)
+            self.has_fts = True
+
+    def add(self, data):
+        """Add or update a single APOD metadata entry"""
+        self.add_many([data])
+
+    def add_many(self, entries, replace=True):
+        """Add or update many APOD metadata entries in one transaction
+
+        With replace=False existing entries are kept as they are. Returns
+        how many dates were new to the catalog.
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        rows = [
+            (
+                data["date"],
+                data.get("title"),
+                data.get("explanation"),
+                data.get("copyright"),
+                data.get("media_type"),
+                data.get("url"),
+                data.get("hdurl"),
+                json.dumps(data),
+                now
+            )
+            for data in entries if data.get("date")
+        ]
+        if not rows:
+            return 0
+
+        if replace:
+            conflict = """DO UPDATE SET
+                    title = excluded.title,
+                    explanation = excluded.explanation,
+                    copyright = excluded.copyright,
+                    media_type = excluded.media_type,
+                    url = excluded.url,
+                    hdurl = excluded.hdurl,
+                    data = excluded.data,
+                    updated_at = excluded.updated_at"""
+        else:
+            conflict = "DO NOTHING"
+
+        with self._lock, self._conn:
+            count_before = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            self._conn.executemany(f"""
+                INSERT INTO entries (date, title, explanation, copyright, media_type, url, hdurl, data, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (date) {conflict}
+            """, rows)
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - count_before
+
+    def iter_entries(self, batch_size=500):
+        """Yield every cataloged entry in date order, a batch at a time"""
+        last_date = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT date, data FROM entries WHERE date > ? ORDER BY date LIMIT ?",
+                    (last_date, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield json.loads(row["data"])
+            last_date = rows[-1]["date"]
+
+    def get(self, date):
+        """Get the metadata for a date, or None if it isn't cataloged"""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM entries WHERE date = ?", (date,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def search(self, query, media_type=None, limit=50):
+        """Full-text search over title, explanation and copyright"""
+        query = query.strip()
+        params = []
+        if self.has_fts:
+            # Quote each word so user input can't break the FTS query syntax
+            terms = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+            sql = ("SELECT e.data FROM entries_fts f JOIN entries e ON e.rowid = f.rowid "
+                   "WHERE entries_fts MATCH ?")
+            params.append(terms)
+            order = " ORDER BY f.rank"
+        else:
+            sql = "SELECT e.data FROM entries e WHERE (e.title LIKE ? OR e.explanation LIKE ? OR e.copyright LIKE ?)"
+            params.extend([f"%{query}%"] * 3)
+            order = " ORDER BY e.date DESC"
+
+        if media_type:
+            sql += " AND e.media_type = ?"
+            params.append(media_type)
+        sql += order + " LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def by_media_type(self, media_type, limit=None):
+        """Get entries of a media type, newest first"""
+        sql = "SELECT data FROM entries WHERE media_type = ? ORDER BY date DESC"
+        params = [media_type]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def list_summaries(self, media_type="image"):
+        """Get (date, title) for every entry of a media type, newest first
+
+        Cheap enough to list the whole archive without decoding metadata.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT date, title FROM entries WHERE media_type = ? ORDER BY date DESC",
+                (media_type,)
+            ).fetchall()
+        return [(row["date"], row["title"]) for row in rows]
+
+    def random_entry(self, media_type="image"):
+        """Pick a random cataloged entry of a media type"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM entries WHERE media_type = ? ORDER BY RANDOM() LIMIT 1",
+                (media_type,)
+            ).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def count(self, media_type=None):
+        """Count cataloged entries, optionally of one media type"""
+        with self._lock:
+            if media_type:
+                row = self._conn.execute("SELECT COUNT(*) FROM entries WHERE media_type = ?", (media_type,)).fetchone()
+            else:
+                row = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        return row[0]
+
+    def add_features_many(self, rows):
+        """Add or update the image features of local files
+
+        Each row is a compute_features() dict plus path, date and mtime.
+        """
+        columns = ("path", "date", "width", "height", "aspect", "brightness",
+                   "dark_fraction", "dominant_color", "mtime")
+        values = [tuple(row.get(column) for column in columns) for row in rows]
+        if not values:
+            return
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO features ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                values
+            )
+
+    def all_features(self):
+        """Get the indexed features of every local file"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM features ORDER BY path").fetchall()
+        return [dict(row) for row in rows]
+
+    def get_features(self, path):
+        """Get the indexed features of a local file, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM features WHERE path = ?", (path,)).fetchone()
+        return dict(row) if row else None
+
+    def select_by_features(self, criteria, limit=None, random_order=False):
+        """Get dates of indexed images matching feature criteria
+
+        criteria may hold min_width, min_height, orientation (landscape,
+        portrait or square), min_aspect, max_aspect, min_brightness,
+        max_brightness, min_dark_fraction and max_dark_fraction.
+        """
+        clauses = []
+        params = []
+
+        def bound(column, operator, value):
+            if value is not None:
+                clauses.append(f"{column} {operator} ?")
+                params.append(value)
+
+        min_aspect, max_aspect = ORIENTATIONS.get(criteria.get("orientation"), (None, None))
+        bound("width", ">=", criteria.get("min_width"))
+        bound("height", ">=", criteria.get("min_height"))
+        bound("aspect", ">=", criteria.get("min_aspect", min_aspect))
+        bound("aspect", "<=", criteria.get("max_aspect", max_aspect))
+        bound("brightness", ">=", criteria.get("min_brightness"))
+        bound("brightness", "<=", criteria.get("max_brightness"))
+        bound("dark_fraction", ">=", criteria.get("min_dark_fraction"))
+        bound("dark_fraction", "<=", criteria.get("max_dark_fraction"))
+
+        sql = "SELECT DISTINCT date FROM features"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY RANDOM()" if random_order else " ORDER BY date DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [row["date"] for row in rows]
+
+    def clear_features(self):
+        """Forget all indexed image features (e.g. after deleting the images)"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM features")
+
+    def get_validators(self, date):
+        """Get the ETag/Last-Modified the API sent with a date's metadata, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified FROM validators WHERE date = ?", (date,)
+            ).fetchone()
+        if not row:
+            return None
+        return {key: row[key] for key in ("etag", "last_modified") if row[key]}
+
+    def set_validators(self, date, validators, checked_at):
+        """Store a date's metadata validators and when they were last checked"""
+        validators = validators or {}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO validators (date, etag, last_modified, checked_at) VALUES (?, ?, ?, ?)",
+                (date, validators.get("etag"), validators.get("last_modified"), checked_at)
+            )
+
+    def validator_check_times(self):
+        """Get when each date's metadata was last fetched or revalidated"""
+        with self._lock:
+            rows = self._conn.execute("SELECT date, checked_at FROM validators").fetchall()
+        return {row["date"]: row["checked_at"] for row in rows}
+
+    def shrink_memory(self):
+        """Release SQLite's page cache back to the allocator"""
+        with self._lock:
+            self._conn.execute("PRAGMA shrink_memory")
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,441 @@
+"""
+Headless command line interface for APODPaper
+
+Drives the APOD client, config and wallpaper manager directly and never
+imports the GUI modules (customtkinter, pystray, Pillow), so it starts
+quickly on machines without a desktop session. When the tray app is
+running, updates are handed to it so the work is never done twice.
+"""
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta
+
+try:
+    from .config import Config
+    from .apod_client import APODClient, IMAGE_NAME_PATTERN
+    from .wallpaper import WallpaperManager
+    from .catalog import Catalog
+    from .image_store import ImageStore
+    from .image_probe import ImageFilter
+    from .proxy import APODProxy, serve
+    from .bulk import BulkProcessor
+    from .instance import send_command
+    from .history import WallpaperHistory
+    from .profiling import Profiler, requested_by_environment
+    from .library_bundle import LibraryBundle
+except ImportError:
+    from config import Config
+    from apod_client import APODClient, IMAGE_NAME_PATTERN
+    from wallpaper import WallpaperManager
+    from catalog import Catalog
+    from image_store import ImageStore
+    from image_probe import ImageFilter
+    from proxy import APODProxy, serve
+    from bulk import BulkProcessor
+    from instance import send_command
+    from history import WallpaperHistory
+    from profiling import Profiler, requested_by_environment
+    from library_bundle import LibraryBundle
+
+
+# Exit codes
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_DOWNLOAD_FAILED = 3
+EXIT_WALLPAPER_FAILED = 4
+EXIT_OFFLINE = 5
+
+# The API serves ranges in one response; keep each request reasonably small
+RANGE_CHUNK_DAYS = 90
+
+# Forwarded updates wait for the tray app's result, which may include a download
+FORWARD_TIMEOUT = 200
+
+
+class HeadlessApp:
+    def __init__(self, api_key=None):
+        self.config = Config()
+        self.catalog = Catalog(self.config.catalog_path)
+        self.image_store = ImageStore(self.config.apod_folder)
+        self.wallpaper_manager = WallpaperManager()
+        self.api_key = api_key or self.config.get_api_key()
+        # An explicit --api-key replaces the configured pool
+        self.api_keys = [api_key] if api_key else self.config.get_api_keys()
+        self.apod_client = APODClient(
+            self.api_keys, self.config.apod_folder, self.catalog, self.image_store,
+            base_url=self.config.get_api_base_url(),
+            image_host=self.config.get_image_host()
+        )
+        self.apod_client.image_filter = ImageFilter(**self.config.get_image_filter_settings())
+        self.apod_client.filter_daily_images = self.config.get_filter_daily_images()
+        self.apod_client.random_criteria = self.config.get_random_criteria()
+        video_thumbnails = self.config.get_video_thumbnail_settings()
+        self.apod_client.use_video_thumbnails = video_thumbnails["enabled"]
+        if video_thumbnails["upscale"]:
+            self.apod_client.video_thumbnail_size = self.wallpaper_manager.get_screen_size()
+        self.apod_client.auto_quality = self.config.get_auto_quality()
+        self.apod_client.screen_size = self.wallpaper_manager.get_screen_size()
+        self.image_store.set_rate_limit(self.config.get_download_rate_limit())
+
+    def require_api_key(self):
+        """Check there is a usable API key, explaining how to set one if not"""
+        if any(self.config.is_valid_api_key(api_key) for api_key in self.api_keys):
+            return True
+        print("No NASA API key configured. Pass --api-key or set NASA_API_KEY in "
+              f"{self.config.config_path}", file=sys.stderr)
+        return False
+
+    def apply(self, result, count_as_update=True):
+        """Set a downloaded image as wallpaper and return an exit code"""
+        if not result:
+            print("Failed to download image", file=sys.stderr)
+            return EXIT_DOWNLOAD_FAILED
+
+        image_path, apod_data = result
+        if not self.wallpaper_manager.set_wallpaper(image_path):
+            return EXIT_WALLPAPER_FAILED
+        WallpaperHistory(self.config.apod_folder).record(image_path, apod_data.get("date"), "cli")
+
+        if apod_data.get("offline"):
+            print(f"Offline, using saved image {image_path}")
+            return EXIT_OFFLINE
+
+        if count_as_update:
+            self.config.update_last_update()
+        print(f"Wallpaper set to {image_path} ({apod_data.get('date', 'unknown date')}: {apod_data.get('title', '')})")
+        return EXIT_OK
+
+    def forward_update(self, **args):
+        """Have the running tray app do an update instead of doing it twice
+
+        Returns an exit code, or None if the tray app isn't running.
+        """
+        reply = send_command(self.config.apod_folder, "update", timeout=FORWARD_TIMEOUT, **args)
+        if reply is None:
+            return None
+
+        if not reply.get("ok"):
+            print(f"APODPaper: {reply.get('error')}", file=sys.stderr)
+            return {
+                "download_failed": EXIT_DOWNLOAD_FAILED,
+                "wallpaper_failed": EXIT_WALLPAPER_FAILED
+            }.get(reply.get("reason"), EXIT_ERROR)
+
+        if reply.get("offline"):
+            print(f"Offline, the running APODPaper is using saved image {reply['path']}")
+            return EXIT_OFFLINE
+        print(f"Wallpaper set by the running APODPaper to {reply['path']} ({reply.get('date')}: {reply.get('title', '')})")
+        return EXIT_OK
+
+
+def cmd_update(app, args):
+    """Download and set today's (or a random) APOD"""
+    if not app.require_api_key():
+        return EXIT_ERROR
+
+    hd = app.config.get_hd_preference() if args.hd is None else args.hd
+    random_date = args.random or app.config.get_random_image_preference()
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    if not args.force and not random_date and app.config.get_config().get("last_update") == today:
+        print("Wallpaper already updated today (use --force to update anyway)")
+        return EXIT_OK
+
+    code = app.forward_update(hd=hd, random_date=random_date)
+    if code is not None:
+        return code
+
+    if not app.apod_client.is_online():
+        return app.apply(app.apod_client.find_latest_local_image(hd), count_as_update=False)
+
+    return app.apply(app.apod_client.download_with_fallback(hd=hd, random_date=random_date))
+
+
+def cmd_set_date(app, args):
+    """Set the wallpaper to the APOD of a specific date"""
+    if not app.require_api_key():
+        return EXIT_ERROR
+
+    hd = app.config.get_hd_preference() if args.hd is None else args.hd
+    code = app.forward_update(date=args.date, hd=hd)
+    if code is not None:
+        return code
+    return app.apply(app.apod_client.download_image(args.date, hd=hd), count_as_update=False)
+
+
+def cmd_prefetch(app, args):
+    """Catalog (and optionally download) every APOD in a date range"""
+    if not app.require_api_key():
+        return EXIT_ERROR
+
+    start = datetime.strptime(args.start_date, "%Y-%m-%d")
+    end = datetime.strptime(args.end_date, "%Y-%m-%d") if args.end_date else datetime.now()
+    hd = app.config.get_hd_preference() if args.hd is None else args.hd
+
+    cataloged = downloaded = failed = 0
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=RANGE_CHUNK_DAYS - 1), end)
+        try:
+            entries = app.apod_client.get_apod_range(
+                chunk_start.strftime("%Y-%m-%d"), chunk_end.strftime("%Y-%m-%d")
+            )
+        except Exception as e:
+            print(e, file=sys.stderr)
+            return EXIT_ERROR
+        cataloged += len(entries)
+        print(f"Cataloged {chunk_start:%Y-%m-%d} to {chunk_end:%Y-%m-%d} ({len(entries)} entries)")
+
+        if args.images:
+            for entry in entries:
+                if entry.get("media_type") != "image":
+                    continue
+                if app.apod_client.download_image(entry["date"], silent=True, hd=hd):
+                    downloaded += 1
+                else:
+                    failed += 1
+
+        chunk_start = chunk_end + timedelta(days=1)
+
+    print(f"Done: {cataloged} cataloged, {downloaded} images available locally, {failed} failed")
+    return EXIT_ERROR if failed else EXIT_OK
+
+
+def cmd_revalidate(app, args):
+    """Check cached entries and images for corrections with conditional requests"""
+    if not app.require_api_key():
+        return EXIT_ERROR
+
+    settings = app.config.get_revalidation_settings()
+    max_age_days = settings["max_age_days"] if args.days is None else args.days
+    limit = settings["limit"] if args.limit is None else args.limit
+    changed = app.apod_client.revalidate_library(max_age_days, limit)
+    print(f"Done: {changed} entries changed")
+    return EXIT_OK
+
+
+def cmd_clean(app, args):
+    """Delete all saved images"""
+    removed = app.image_store.clean_library()
+    app.catalog.clear_features()
+    # The playlist only lists deleted images now
+    try:
+        os.remove(os.path.join(app.config.apod_folder, "playlist.json"))
+    except FileNotFoundError:
+        pass
+    print(f"Removed {removed} saved image(s)")
+    return EXIT_OK
+
+
+def cmd_status(app, args):
+    """Print configuration and library status"""
+    config_data = app.config.get_config()
+    api_key = app.api_key
+    masked_key = f"{api_key[:8]}...{api_key[-4:]}" if len(api_key) > 12 else "DEMO_KEY"
+
+    images = [name for name in os.listdir(app.config.apod_folder) if IMAGE_NAME_PATTERN.match(name)]
+    blob_bytes = 0
+    for folder, _, files in os.walk(app.image_store.blobs_folder):
+        blob_bytes += sum(os.path.getsize(os.path.join(folder, name)) for name in files)
+
+    print(f"Data folder:      {app.config.apod_folder}")
+    print(f"API key:          {masked_key}")
+    print(f"Last update:      {config_data.get('last_update') or 'never'}")
+    print(f"Auto-update:      {'on' if config_data.get('auto_update', True) else 'off'}")
+    print(f"HD images:        {'on' if app.config.get_hd_preference() else 'off'}")
+    print(f"Random images:    {'on' if app.config.get_random_image_preference() else 'off'}")
+    print(f"Local images:     {len(images)} ({blob_bytes / (1024 * 1024):.1f} MB)")
+    print(f"Catalog entries:  {app.catalog.count()} ({app.catalog.count('image')} images)")
+    print(f"API reachable:    {'yes' if app.apod_client.is_online() else 'no'}")
+
+    pool = app.apod_client.key_pool.describe()
+    if len(pool) > 1:
+        for index, (key_name, remaining, quarantined_until) in enumerate(pool):
+            state = f"resting until {datetime.fromtimestamp(quarantined_until):%H:%M}" if quarantined_until else f"~{remaining} requests left"
+            print(f"{'API key pool:' if index == 0 else '':<18}{key_name} ({state})")
+
+    reply = send_command(app.config.apod_folder, "status", timeout=2)
+    if reply and reply.get("ok"):
+        running = reply["status"]
+        activity = "updating" if running["updating"] else "offline" if running["offline"] else "idle"
+        print(f"Tray app:         running (pid {running['pid']}, {activity}, {running['memory']})")
+    else:
+        print("Tray app:         not running")
+    return EXIT_OK
+
+
+def cmd_settings(app, args):
+    """Open the settings window of the running tray app"""
+    if send_command(app.config.apod_folder, "settings") is None:
+        print("APODPaper isn't running; start it to change settings", file=sys.stderr)
+        return EXIT_ERROR
+    return EXIT_OK
+
+
+def cmd_serve(app, args):
+    """Run the shared caching proxy"""
+    if not app.require_api_key():
+        return EXIT_ERROR
+
+    apod_proxy = APODProxy(app.api_keys, app.config.apod_folder, app.catalog, app.image_store, args.public_url)
+    try:
+        serve(apod_proxy, args.host, args.port)
+    except KeyboardInterrupt:
+        pass
+    return EXIT_OK
+
+
+def cmd_process(app, args):
+    """Hash, index features and make thumbnails/derivatives for the whole library"""
+    folder = app.config.apod_folder
+    paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if IMAGE_NAME_PATTERN.match(name)]
+
+    processor = BulkProcessor(
+        folder,
+        workers=args.workers or app.config.get_bulk_workers(),
+        low_priority=app.config.get_bulk_low_priority()
+    )
+    derivative_size = app.wallpaper_manager.get_screen_size() if args.derivatives else None
+
+    def progress(done, total, rate):
+        print(f"\r{done}/{total} images ({rate:.1f}/s)", end="", flush=True)
+
+    print(f"Processing {len(paths)} images with {processor.workers} worker(s)")
+    processed, failed = processor.run(paths, not args.no_thumbnails, derivative_size, progress)
+
+    # Fill the feature index in one transaction from everything processed so far
+    features = []
+    for result in processor.checkpoint.values():
+        match = IMAGE_NAME_PATTERN.match(os.path.basename(result["path"]))
+        if match and "features" in result:
+            date = datetime.strptime(match.group(1), "%Y%m%d").strftime("%Y-%m-%d")
+            features.append(dict(result["features"], path=result["path"], date=date, mtime=result["mtime"]))
+    app.catalog.add_features_many(features)
+    print(f"\nDone: {processed} processed, {failed} failed, {len(paths) - processed} already up to date")
+    return EXIT_ERROR if failed else EXIT_OK
+
+
+def cmd_export(app, args):
+    """Write the library to a bundle for seeding another machine"""
+    bundle = LibraryBundle(app.config.apod_folder, app.catalog, app.image_store)
+    stats = bundle.export_to(args.path, derivatives=not args.no_derivatives)
+    # Keep stdout clean when the bundle itself goes there
+    print(f"Exported {stats['images']} images ({stats['blobs']} unique), {stats['entries']} catalog entries "
+          f"and {stats['files']} thumbnails/derivatives", file=sys.stderr if args.path == "-" else sys.stdout)
+    return EXIT_OK
+
+
+def cmd_import(app, args):
+    """Merge a library bundle into this machine's library"""
+    bundle = LibraryBundle(app.config.apod_folder, app.catalog, app.image_store)
+    stats = bundle.import_from(args.path)
+    print(f"Imported {stats['images']} images ({stats['blobs']} new blobs, {stats['blobs_skipped']} already stored), "
+          f"{stats['entries']} catalog entries and {stats['files']} thumbnails/derivatives")
+    return EXIT_OK
+
+
+def parse_date(value):
+    """argparse type for YYYY-MM-DD dates"""
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}', expected YYYY-MM-DD")
+    return value
+
+
+def build_parser():
+    """Build the argument parser"""
+    parser = argparse.ArgumentParser(prog="apodpaper", description="NASA APOD wallpaper, without the UI")
+    parser.add_argument("--api-key", help="NASA API key to use instead of the configured one")
+    parser.add_argument("--profile", action="store_true", help="write CPU and memory profiles of the command")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_quality_flags(subparser):
+        quality = subparser.add_mutually_exclusive_group()
+        quality.add_argument("--hd", dest="hd", action="store_true", default=None, help="download HD images")
+        quality.add_argument("--sd", dest="hd", action="store_false", help="download standard images")
+
+    update = subparsers.add_parser("update", help="download and set today's APOD")
+    update.add_argument("--random", action="store_true", help="use a random APOD")
+    update.add_argument("--force", action="store_true", help="update even if already updated today")
+    add_quality_flags(update)
+    update.set_defaults(func=cmd_update)
+
+    set_date = subparsers.add_parser("set-date", help="set the wallpaper to a specific date's APOD")
+    set_date.add_argument("date", type=parse_date)
+    add_quality_flags(set_date)
+    set_date.set_defaults(func=cmd_set_date)
+
+    prefetch = subparsers.add_parser("prefetch", help="catalog and optionally download a date range")
+    prefetch.add_argument("start_date", type=parse_date)
+    prefetch.add_argument("end_date", type=parse_date, nargs="?", help="defaults to today")
+    prefetch.add_argument("--images", action="store_true", help="also download the images")
+    add_quality_flags(prefetch)
+    prefetch.set_defaults(func=cmd_prefetch)
+
+    revalidate = subparsers.add_parser("revalidate", help="check cached entries for corrections by NASA")
+    revalidate.add_argument("--days", type=int, help="recheck entries not checked for this many days")
+    revalidate.add_argument("--limit", type=int, help="most entries to check in this run")
+    revalidate.set_defaults(func=cmd_revalidate)
+
+    clean = subparsers.add_parser("clean", help="delete all saved images")
+    clean.set_defaults(func=cmd_clean)
+
+    status = subparsers.add_parser("status", help="show settings and library status")
+    status.set_defaults(func=cmd_status)
+
+    settings = subparsers.add_parser("settings", help="open the settings window of the running app")
+    settings.set_defaults(func=cmd_settings)
+
+    process = subparsers.add_parser("process", help="hash and make thumbnails for the whole library")
+    process.add_argument("--workers", type=int, help="worker processes (default: all cores but one)")
+    process.add_argument("--derivatives", action="store_true", help="also make screen-sized copies")
+    process.add_argument("--no-thumbnails", action="store_true", help="skip thumbnail generation")
+    process.set_defaults(func=cmd_process)
+
+    export = subparsers.add_parser("export", help="write the library to a bundle for another machine")
+    export.add_argument("path", help="bundle file to write, or - for stdout")
+    export.add_argument("--no-derivatives", action="store_true", help="leave out the screen-sized copies")
+    export.set_defaults(func=cmd_export)
+
+    import_parser = subparsers.add_parser("import", help="merge a library bundle into this library")
+    import_parser.add_argument("path", help="bundle file to read, or - for stdin")
+    import_parser.set_defaults(func=cmd_import)
+
+    serve_parser = subparsers.add_parser("serve", help="run a caching proxy for other APODPaper clients")
+    serve_parser.add_argument("--host", default="0.0.0.0", help="address to listen on (default: all)")
+    serve_parser.add_argument("--port", type=int, default=8080, help="port to listen on (default: 8080)")
+    serve_parser.add_argument("--public-url", help="URL clients reach the proxy at, if not the Host header")
+    serve_parser.set_defaults(func=cmd_serve)
+
+    return parser
+
+
+def main(argv=None):
+    """CLI entry point; returns the process exit code"""
+    args = build_parser().parse_args(argv)
+    try:
+        app = HeadlessApp(args.api_key)
+        # An explicit --hd/--sd beats automatic quality
+        if getattr(args, "hd", None) is not None:
+            app.apod_client.auto_quality = False
+
+        if not (args.profile or requested_by_environment()):
+            return args.func(app, args)
+        profiler = Profiler(app.config.apod_folder)
+        profiler.enable()
+        try:
+            return profiler.profile_call(args.command, args.func, app, args)
+        finally:
+            profiler.disable()
+    except KeyboardInterrupt:
+        return EXIT_ERROR
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+
+
+if __name__ == "__main__":
+    sys.exit(main())
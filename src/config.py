@@ -3,25 +3,36 @@ Configuration management for APODPaper
 """
 import os
 import json
+import threading
 from datetime import datetime
 
 
 class Config:
+    _lock = threading.RLock()
+
     def __init__(self):
         self.appdata_local = os.getenv('LOCALAPPDATA')
         self.apod_folder = os.path.join(self.appdata_local, 'apodpaper')
         self.config_path = os.path.join(self.apod_folder, 'config.json')
+        self.catalog_path = os.path.join(self.apod_folder, 'catalog.db')
         self.ensure_folder_exists()
     
     def ensure_folder_exists(self):
         """Ensure the apod folder exists"""
         os.makedirs(self.apod_folder, exist_ok=True)
     
+    def load_config(self):
+        """Load configuration from file, raising OSError or ValueError if it can't be read"""
+        with open(self.config_path, "r") as f:
+            config = json.load(f)
+        if not isinstance(config, dict):
+            raise ValueError("config.json doesn't hold an object")
+        return config
+
     def get_config(self):
         """Load configuration from file"""
         try:
-            with open(self.config_path, "r") as f:
-                return json.load(f)
+            return self.load_config()
         except:
             return {
                 "NASA_API_KEY": "DEMO_KEY", 
@@ -33,20 +44,39 @@ class Config:
     
     def save_config(self, config_data):
         """Save configuration to file"""
-        with open(self.config_path, "w") as f:
-            json.dump(config_data, f, indent=2)
+        # Background threads save too, so replace the file atomically
+        with self._lock:
+            temp_path = self.config_path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(config_data, f, indent=2)
+            os.replace(temp_path, self.config_path)
+
+    def update(self, **changes):
+        """Set config keys in one locked read-modify-write, so concurrent updates don't undo each other"""
+        with self._lock:
+            config = self.get_config()
+            config.update(changes)
+            self.save_config(config)
+            return config
     
     def get_api_key(self):
         """Get the NASA API key from config"""
         config = self.get_config()
         return config.get("NASA_API_KEY", "DEMO_KEY")
     
+    def get_api_keys(self):
+        """Get every NASA API key to spread requests over
+
+        NASA_API_KEYS holds extra keys; NASA_API_KEY is always part of the pool.
+        """
+        config = self.get_config()
+        keys = [config.get("NASA_API_KEY", "DEMO_KEY")] + list(config.get("NASA_API_KEYS") or [])
+        valid_keys = [key for key in dict.fromkeys(keys) if isinstance(key, str) and self.is_valid_api_key(key)]
+        return valid_keys or ["DEMO_KEY"]
+
     def set_api_key(self, api_key):
         """Set the NASA API key in config"""
-        config = self.get_config()
-        config["NASA_API_KEY"] = api_key
-        config["last_update"] = ""
-        self.save_config(config)
+        self.update(NASA_API_KEY=api_key, last_update="")
     
     def is_valid_api_key(self, api_key):
         """Check if API key is valid (not DEMO_KEY)"""
@@ -54,16 +84,13 @@ class Config:
     
     def update_last_update(self):
         """Update the last update timestamp"""
-        config = self.get_config()
-        config["last_update"] = datetime.now().strftime("%Y-%m-%d")
-        self.save_config(config)
+        self.update(last_update=datetime.now().strftime("%Y-%m-%d"))
     
     def toggle_auto_update(self):
         """Toggle automatic updates on/off"""
-        config = self.get_config()
-        config["auto_update"] = not config.get("auto_update", True)
-        self.save_config(config)
-        return config["auto_update"]
+        with self._lock:
+            config = self.get_config()
+            return self.update(auto_update=not config.get("auto_update", True))["auto_update"]
     
     def get_hd_preference(self):
         """Get HD image preference"""
@@ -72,9 +99,7 @@ class Config:
     
     def set_hd_preference(self, hd_enabled):
         """Set HD image preference"""
-        config = self.get_config()
-        config["hd_images"] = hd_enabled
-        self.save_config(config)
+        self.update(hd_images=hd_enabled)
     
     def get_random_image_preference(self):
         """Get random image preference"""
@@ -83,6 +108,137 @@ class Config:
     
     def set_random_image_preference(self, random_enabled):
         """Set random image preference"""
+        self.update(random_images=random_enabled)
+
+    def get_notification_style(self):
+        """Get notification style ("toast" or "tray")"""
+        config = self.get_config()
+        return config.get("notification_style", "toast")
+
+    def get_prefetch_enabled(self):
+        """Get background prefetch preference"""
+        config = self.get_config()
+        return config.get("prefetch", True)
+
+    def get_prefetch_on_battery(self):
+        """Get whether prefetching may run on battery power"""
+        config = self.get_config()
+        return config.get("prefetch_on_battery", False)
+
+    def is_metered_connection(self):
+        """Check if the user marked the connection as metered"""
+        config = self.get_config()
+        return config.get("metered_connection", False)
+
+    def get_prefetched_random(self):
+        """Get the prefetched random image entry, if any"""
+        config = self.get_config()
+        return config.get("prefetched_random")
+
+    def set_prefetched_random(self, entry):
+        """Set (or clear with None) the prefetched random image entry"""
+        self.update(prefetched_random=entry)
+
+    def get_rotation_enabled(self):
+        """Get whether the wallpaper rotates through the local library"""
+        config = self.get_config()
+        return config.get("rotation_enabled", False)
+
+    def get_rotation_interval(self):
+        """Get the rotation interval in minutes"""
+        config = self.get_config()
+        return max(int(config.get("rotation_interval_minutes", 60)), 1)
+
+    def get_rotation_order(self):
+        """Get the playlist order ("shuffle", "weighted" or "chronological")"""
+        config = self.get_config()
+        return config.get("rotation_order", "shuffle")
+
+    def get_rotation_date_range(self):
+        """Get the (start, end) date filter for the playlist; either may be empty"""
+        config = self.get_config()
+        return config.get("rotation_start_date", ""), config.get("rotation_end_date", "")
+
+    def get_image_filter_settings(self):
+        """Get the wallpaper size filter as a dict of ImageFilter arguments"""
+        config = self.get_config()
+        # No size limits unless configured: with HD off they would be checked
+        # against standard images, which are often smaller than any useful default
+        return {
+            "min_width": config.get("min_image_width", 0),
+            "min_height": config.get("min_image_height", 0),
+            "min_aspect": config.get("min_aspect_ratio", 1.0),
+            "max_aspect": config.get("max_aspect_ratio", 3.0)
+        }
+
+    def get_filter_daily_images(self):
+        """Get whether the size filter also applies to today's image"""
+        config = self.get_config()
+        return config.get("filter_daily_images", False)
+
+    def get_api_base_url(self):
+        """Get the APOD API endpoint (e.g. a site caching proxy), or None for NASA"""
+        config = self.get_config()
+        return config.get("api_base_url") or None
+
+    def get_image_host(self):
+        """Get the URL prefix images are fetched through, or None for direct"""
+        config = self.get_config()
+        return config.get("image_host") or None
+
+    def get_bulk_workers(self):
+        """Get the number of worker processes for bulk jobs (None for all but one core)"""
+        config = self.get_config()
+        return config.get("bulk_workers") or None
+
+    def get_bulk_low_priority(self):
+        """Get whether bulk workers run below normal priority"""
+        config = self.get_config()
+        return config.get("bulk_low_priority", True)
+
+    def get_random_criteria(self):
+        """Get the feature criteria random picks should match, or None for any image"""
+        config = self.get_config()
+        return config.get("random_criteria") or None
+
+    def get_revalidation_settings(self):
+        """Get how often cached entries are revalidated and how many per sweep"""
+        config = self.get_config()
+        return {
+            "max_age_days": config.get("revalidate_days", 30),
+            "limit": config.get("revalidate_batch", 20)
+        }
+
+    def get_video_thumbnail_settings(self):
+        """Get whether video days use the video's thumbnail and whether to upscale it"""
+        config = self.get_config()
+        return {
+            "enabled": config.get("video_thumbnails", False),
+            "upscale": config.get("upscale_video_thumbnails", True)
+        }
+
+    def get_auto_quality(self):
+        """Get whether HD or standard is chosen per download from measured bandwidth"""
+        config = self.get_config()
+        return config.get("image_quality") == "auto"
+
+    def get_download_rate_limit(self):
+        """Get the download bandwidth cap in bytes per second, or None for no cap"""
+        config = self.get_config()
+        limit_kb = config.get("max_download_kb_per_second")
+        return int(limit_kb * 1024) if limit_kb else None
+
+    def get_profiling_enabled(self):
+        """Get whether CPU and memory profiling runs from startup"""
+        config = self.get_config()
+        return config.get("profiling", False)
+
+    def get_debug_menu(self):
+        """Get whether the tray menu shows its diagnostics items"""
+        config = self.get_config()
+        return config.get("debug_menu", False)
+
+    def get_memory_ceiling_mb(self):
+        """Get the resident memory (MB) above which the tray process trims itself"""
         config = self.get_config()
-        config["random_images"] = random_enabled
-        self.save_config(config)
+        return config.get("memory_ceiling_mb", 80)
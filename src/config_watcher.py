@@ -0,0 +1,79 @@
+"""
+Live reloading of config.json edits, by the app or by hand
+"""
+import os
+import threading
+
+
+class ConfigWatcher:
+    # How often config.json's modification time is checked
+    POLL_SECONDS = 2
+
+    def __init__(self, config):
+        self.config = config
+        self._handlers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._mtime = self._read_mtime()
+        self._snapshot = config.get_config()
+        # Modification time of a file already reported as unreadable
+        self._bad_mtime = None
+
+    def _read_mtime(self):
+        try:
+            return os.stat(self.config.config_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def on_change(self, keys, handler):
+        """Call handler(changed_keys) when any of these config keys changes"""
+        self._handlers.append((frozenset(keys), handler))
+
+    def check(self):
+        """Apply changes made to the config file since the last check
+
+        Returns the set of keys that changed.
+        """
+        with self._lock:
+            mtime = self._read_mtime()
+            if mtime == self._mtime:
+                return set()
+
+            # get_config() would hand back the defaults for a half-saved file, which
+            # looks like every setting changed; wait for a file that parses instead
+            try:
+                current = self.config.load_config()
+            except (OSError, ValueError) as e:
+                if mtime != self._bad_mtime:
+                    self._bad_mtime = mtime
+                    print(f"Ignoring config.json until it can be read again: {e}")
+                return set()
+
+            self._mtime = mtime
+            previous = self._snapshot
+            self._snapshot = current
+            changed = {key for key in previous.keys() | current.keys() if previous.get(key) != current.get(key)}
+
+            for keys, handler in self._handlers:
+                if keys & changed:
+                    try:
+                        handler(changed)
+                    except Exception as e:
+                        print(f"Failed to apply config change to {', '.join(sorted(keys & changed))}: {e}")
+        return changed
+
+    def _run(self):
+        while not self._stop.wait(self.POLL_SECONDS):
+            self.check()
+
+    def start(self):
+        """Start watching in a background thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop watching"""
+        self._stop.set()
@@ -0,0 +1,195 @@
+"""
+Pool of NASA API keys with per-key quota tracking
+
+Each request goes out with the key that has the most quota left. Keys the
+API refuses (429 Too Many Requests, 403 Forbidden) sit out a cooldown, and
+the pool's state is shared through a file by every APODPaper process
+(tray app, CLI runs, the proxy).
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+# Statuses with which api.nasa.gov refuses a key
+RATE_LIMITED_STATUSES = (429, 403)
+
+
+class KeysExhausted(Exception):
+    """Every key in the pool is cooling down"""
+
+
+def key_id(api_key):
+    """Stable, non-secret name for a key, used in saved state and output"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class KeyPool:
+    # Hourly quota assumed until the API reports one (api.nasa.gov's default)
+    DEFAULT_LIMIT = 1000
+    # The API's quota window; used quota comes back gradually over it
+    WINDOW_SECONDS = 60 * 60
+    # How long a refused key is left alone
+    QUARANTINE_SECONDS = 60 * 60
+
+    def __init__(self, keys, state_path=None):
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._keys = []
+        # Modification time of the state file as last read or written by this pool
+        self._saved_mtime = None
+        self._state = {}
+        self._merge_saved_state()
+        # Requests sent but not reported yet, per key id; never saved
+        self._in_flight = {}
+        self.set_keys(keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _load_state(self):
+        if not self.state_path:
+            return {}
+        try:
+            with open(self.state_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _merge_saved_state(self, force=False):
+        """Fold in what other processes (tray app, CLI runs, the proxy) saved; caller holds the lock
+
+        Per key, the later quarantine and the more recent quota observation win.
+        """
+        if not self.state_path:
+            return
+        try:
+            mtime = os.stat(self.state_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._saved_mtime and not force:
+            return
+        self._saved_mtime = mtime
+
+        for name, saved in self._load_state().items():
+            if not isinstance(saved, dict):
+                continue
+            state = self._state.setdefault(name, {})
+            if saved.get("quarantined_until", 0) > state.get("quarantined_until", 0):
+                state["quarantined_until"] = saved["quarantined_until"]
+            if saved.get("observed_at", 0) > state.get("observed_at", 0) and "remaining" in saved:
+                state["remaining"] = saved["remaining"]
+                state["observed_at"] = saved["observed_at"]
+                if "limit" in saved:
+                    state["limit"] = saved["limit"]
+
+    def _save_state(self):
+        """Persist quota and quarantine of every key; caller holds the lock"""
+        if not self.state_path:
+            return
+        # Don't overwrite what another process saved in the meantime
+        self._merge_saved_state(force=True)
+        temp_path = self.state_path + ".tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(self._state, f)
+            os.replace(temp_path, self.state_path)
+            self._saved_mtime = os.stat(self.state_path).st_mtime_ns
+        except OSError as e:
+            print(f"Could not save API key state: {e}")
+
+    def set_keys(self, keys):
+        """Replace the keys, keeping what is known about ones still in the pool"""
+        if isinstance(keys, str):
+            keys = [keys]
+        keys = list(dict.fromkeys(key for key in keys if key))
+        with self._lock:
+            self._keys = keys
+            for key in keys:
+                self._state.setdefault(key_id(key), {})
+
+    def _remaining(self, state, now):
+        """Estimate a key's quota left now, crediting back what the window has returned"""
+        limit = state.get("limit", self.DEFAULT_LIMIT)
+        if "remaining" not in state:
+            return limit
+        recovered = (now - state["observed_at"]) / self.WINDOW_SECONDS * limit
+        return min(limit, state["remaining"] + recovered)
+
+    def acquire(self):
+        """Get the usable key with the most quota left
+
+        Raises KeysExhausted if every key is cooling down.
+        """
+        now = time.time()
+        with self._lock:
+            self._merge_saved_state()
+            best_key, best_remaining = None, None
+            for key in self._keys:
+                state = self._state[key_id(key)]
+                if state.get("quarantined_until", 0) > now:
+                    continue
+                remaining = self._remaining(state, now) - self._in_flight.get(key_id(key), 0)
+                if best_key is None or remaining > best_remaining:
+                    best_key, best_remaining = key, remaining
+
+            if best_key is None:
+                retry_at = min(self._state[key_id(key)]["quarantined_until"] for key in self._keys)
+                raise KeysExhausted(f"all API keys are rate limited, retry after {time.strftime('%H:%M', time.localtime(retry_at))}")
+
+            # Counted against the key until its response is reported, so parallel requests spread out
+            self._in_flight[key_id(best_key)] = self._in_flight.get(key_id(best_key), 0) + 1
+            return best_key
+
+    def report(self, key, status_code, headers):
+        """Record the outcome of a request made with a key from acquire()"""
+        now = time.time()
+        with self._lock:
+            self._finish(key)
+            state = self._state.setdefault(key_id(key), {})
+
+            limit = headers.get("X-RateLimit-Limit")
+            remaining = headers.get("X-RateLimit-Remaining")
+            if limit and limit.isdigit():
+                state["limit"] = int(limit)
+            if remaining and remaining.isdigit():
+                state["remaining"] = int(remaining)
+                state["observed_at"] = now
+
+            if status_code in RATE_LIMITED_STATUSES:
+                state["quarantined_until"] = now + self.QUARANTINE_SECONDS
+                state["remaining"] = 0
+                state["observed_at"] = now
+                print(f"API key {key_id(key)} refused with {status_code}, resting it for "
+                      f"{self.QUARANTINE_SECONDS // 60} minutes")
+            elif remaining is None and limit is None:
+                # Proxies and mirrors don't report quota; nothing to update
+                return
+            self._save_state()
+
+    def release(self, key):
+        """Give back a key from acquire() whose request never got a response"""
+        with self._lock:
+            self._finish(key)
+
+    def _finish(self, key):
+        """Stop counting a request against its key; caller holds the lock"""
+        self._in_flight[key_id(key)] = max(self._in_flight.get(key_id(key), 0) - 1, 0)
+
+    def describe(self):
+        """Get (key id, estimated quota left, quarantined until or None) for each key"""
+        now = time.time()
+        with self._lock:
+            self._merge_saved_state()
+            summary = []
+            for key in self._keys:
+                state = self._state[key_id(key)]
+                quarantined_until = state.get("quarantined_until", 0)
+                summary.append((
+                    key_id(key),
+                    int(self._remaining(state, now)),
+                    quarantined_until if quarantined_until > now else None
+                ))
+        return summary
@@ -0,0 +1,95 @@
+"""
+Image features for picking wallpapers by look rather than at random
+
+Features come from a small reduced-size decode, so indexing an image costs
+a fraction of a full decode. NumPy is used when installed; Pillow's own
+statistics give the same numbers without it.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Images are analysed at roughly this size
+SAMPLE_SIZE = (128, 128)
+
+# Luminance below this (0-255) counts as black space
+DARK_LEVEL = 32
+
+# Channel values are bucketed into 4 levels each (64 colours) to find the dominant colour
+COLOR_BUCKET = 64
+
+# Named orientations accepted in selection criteria, as aspect ratio ranges
+ORIENTATIONS = {
+    "landscape": (1.1, None),
+    "portrait": (None, 0.9),
+    "square": (0.9, 1.1),
+}
+
+
+def compute_features(path):
+    """Measure size, brightness, dominant colour and black-space fraction of an image
+
+    A module-level function so process pools can run it as well.
+    """
+    from PIL import Image
+
+    with Image.open(path) as image:
+        # Full size first; draft() changes what size reports
+        width, height = image.size
+        image.draft("RGB", SAMPLE_SIZE)
+        image.thumbnail(SAMPLE_SIZE)
+        sample = image.convert("RGB")
+
+    if np is not None:
+        brightness, dark_fraction, dominant = _pixel_stats_numpy(sample)
+    else:
+        brightness, dark_fraction, dominant = _pixel_stats_pillow(sample)
+
+    return {
+        "width": width,
+        "height": height,
+        "aspect": round(width / height, 4) if height else 0.0,
+        "brightness": round(brightness, 4),
+        "dark_fraction": round(dark_fraction, 4),
+        "dominant_color": "#{:02x}{:02x}{:02x}".format(*dominant)
+    }
+
+
+def _pixel_stats_numpy(sample):
+    pixels = np.asarray(sample, dtype=np.float32).reshape(-1, 3)
+    luminance = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    buckets = (pixels // COLOR_BUCKET).astype(np.int32)
+    codes = buckets[:, 0] * 16 + buckets[:, 1] * 4 + buckets[:, 2]
+    code = int(np.bincount(codes, minlength=64).argmax())
+
+    return (
+        float(luminance.mean()) / 255,
+        float((luminance < DARK_LEVEL).mean()),
+        _bucket_color(code)
+    )
+
+
+def _pixel_stats_pillow(sample):
+    from PIL import ImageStat
+
+    gray = sample.convert("L")
+    histogram = gray.histogram()
+    total = sum(histogram) or 1
+
+    bucketed = sample.point(lambda value: value // COLOR_BUCKET)
+    count, (r, g, b) = max(bucketed.getcolors(maxcolors=64))
+
+    return (
+        ImageStat.Stat(gray).mean[0] / 255,
+        sum(histogram[:DARK_LEVEL]) / total,
+        _bucket_color(r * 16 + g * 4 + b)
+    )
+
+
+def _bucket_color(code):
+    """Get the centre colour of a bucket code"""
+    half = COLOR_BUCKET // 2
+    return tuple((code >> shift & 3) * COLOR_BUCKET + half for shift in (4, 2, 0))
@@ -0,0 +1,226 @@
+"""
+Virtualized thumbnail gallery of the local APOD library
+"""
+import math
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import customtkinter as ctk
+from PIL import Image
+
+try:
+    from .gui import Theme, WindowUtils
+    from .thumbnails import ThumbnailCache
+except ImportError:
+    from gui import Theme, WindowUtils
+    from thumbnails import ThumbnailCache
+
+
+class GalleryWindow:
+    COLUMNS = 4
+    CELL_WIDTH = 220
+    CELL_HEIGHT = 190
+    # Decoded thumbnails kept in memory; everything else stays on disk
+    MEMORY_CACHE_SIZE = 200
+    RESULT_POLL_MS = 50
+
+    def __init__(self, app_controller):
+        self.app = app_controller
+        self.thumbnails = ThumbnailCache(app_controller.config.apod_folder)
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.results = queue.Queue()
+        self.images = OrderedDict()
+        self.pending = set()
+        self.visible_paths = set()
+        self.entries = []
+        self.cells = []
+        self.offset = 0
+        self.window = None
+        self.viewport = None
+        self.scrollbar = None
+
+    def load_entries(self):
+        """List local images plus cataloged images that aren't downloaded yet"""
+        local = dict(self.app.rotation.list_library())
+        entries = [
+            {"date": date, "title": title or "", "path": local.pop(date, None)}
+            for date, title in self.app.catalog.list_summaries("image")
+        ]
+        entries.extend({"date": date, "title": "", "path": path} for date, path in local.items())
+        entries.sort(key=lambda entry: entry["date"], reverse=True)
+        self.entries = entries
+
+    def show(self):
+        """Open the gallery window"""
+        self.load_entries()
+
+        window = ctk.CTkToplevel(self.app.root)
+        window.title(f"APODPaper - Gallery ({len(self.entries)} images)")
+        window.geometry(f"{self.COLUMNS * self.CELL_WIDTH + 30}x700")
+        window.configure(fg_color=Theme.SPACE_BLACK)
+        WindowUtils.set_window_icon(window)
+        self.window = window
+
+        self.scrollbar = ctk.CTkScrollbar(window, command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.viewport = ctk.CTkFrame(window, fg_color=Theme.SPACE_BLACK, corner_radius=0)
+        self.viewport.pack(side="left", fill="both", expand=True)
+        self.viewport.bind("<Configure>", lambda e: self._layout())
+
+        window.bind("<MouseWheel>", self._on_mousewheel)
+        window.protocol("WM_DELETE_WINDOW", self.close)
+        window.after(self.RESULT_POLL_MS, self._drain_results)
+
+        window.focus_set()
+        window.lift()
+        return window
+
+    def close(self):
+        """Close the window and let queued thumbnail work drain away"""
+        self.visible_paths = set()
+        self.executor.shutdown(wait=False)
+        self.images.clear()
+        if self.window is not None:
+            self.window.destroy()
+            self.window = None
+
+    def _create_cell(self):
+        """Create one reusable gallery cell"""
+        cell = ctk.CTkFrame(self.viewport, width=self.CELL_WIDTH - 10, height=self.CELL_HEIGHT - 10,
+                            fg_color=Theme.SECONDARY)
+        cell.pack_propagate(False)
+        cell.image_label = ctk.CTkLabel(cell, text="", height=self.thumbnails.size[1],
+                                        text_color=Theme.TEXT)
+        cell.image_label.pack(pady=(5, 0))
+        cell.caption = ctk.CTkLabel(cell, text="", font=ctk.CTkFont(size=11),
+                                    text_color=Theme.TEXT, wraplength=self.CELL_WIDTH - 20)
+        cell.caption.pack()
+        cell.entry = None
+
+        for widget in (cell, cell.image_label, cell.caption):
+            widget.bind("<Button-1>", lambda e, cell=cell: self._select(cell.entry))
+        return cell
+
+    def _layout(self):
+        """Place just enough cells to cover the viewport at the scroll offset"""
+        if self.viewport is None:
+            return
+
+        view_height = max(self.viewport.winfo_height(), 1)
+        content_height = max(math.ceil(len(self.entries) / self.COLUMNS) * self.CELL_HEIGHT, 1)
+        self.offset = min(max(self.offset, 0), max(content_height - view_height, 0))
+
+        # One extra row covers the partially visible row when scrolled mid-cell
+        needed = (math.ceil(view_height / self.CELL_HEIGHT) + 1) * self.COLUMNS
+        while len(self.cells) < needed:
+            self.cells.append(self._create_cell())
+
+        first_row, shift = divmod(self.offset, self.CELL_HEIGHT)
+        visible_paths = set()
+        for i, cell in enumerate(self.cells):
+            row, column = divmod(i, self.COLUMNS)
+            index = (first_row + row) * self.COLUMNS + column
+            if i >= needed or index >= len(self.entries):
+                cell.place_forget()
+                cell.entry = None
+                continue
+
+            cell.place(x=column * self.CELL_WIDTH + 5, y=row * self.CELL_HEIGHT - shift + 5)
+            entry = self.entries[index]
+            if entry["path"]:
+                visible_paths.add(entry["path"])
+            if cell.entry is not entry:
+                self._bind_cell(cell, entry)
+
+        self.visible_paths = visible_paths
+        self.scrollbar.set(self.offset / content_height, min((self.offset + view_height) / content_height, 1.0))
+
+    def _bind_cell(self, cell, entry):
+        """Show an entry in a recycled cell"""
+        cell.entry = entry
+        title = entry["title"]
+        if len(title) > 28:
+            title = title[:27] + "…"
+        cell.caption.configure(text=f"{entry['date']}\n{title}")
+
+        path = entry["path"]
+        if path is None:
+            cell.image_label.configure(image=None, text="Not downloaded yet\nClick to fetch")
+        elif path in self.images:
+            self.images.move_to_end(path)
+            cell.image_label.configure(image=self.images[path], text="")
+        else:
+            cell.image_label.configure(image=None, text="Loading…")
+            self._request_thumbnail(path)
+
+    def _request_thumbnail(self, path):
+        """Queue a thumbnail for background loading"""
+        if path in self.pending:
+            return
+        self.pending.add(path)
+        try:
+            self.executor.submit(self._load_thumbnail, path)
+        except RuntimeError:
+            # Executor already shut down; the window is closing
+            self.pending.discard(path)
+
+    def _load_thumbnail(self, path):
+        """Worker: load (creating if needed) a thumbnail off the Tk thread"""
+        # Skip work for cells scrolled out of view while this was queued
+        if path not in self.visible_paths:
+            self.results.put((path, None))
+            return
+        try:
+            with Image.open(self.thumbnails.get(path)) as image:
+                image.load()
+                self.results.put((path, image.copy()))
+        except Exception as e:
+            print(f"Could not load thumbnail for {path}: {e}")
+            self.results.put((path, None))
+
+    def _drain_results(self):
+        """Attach finished thumbnails to the cells that show them"""
+        if self.window is None:
+            return
+
+        while True:
+            try:
+                path, image = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.discard(path)
+            if image is None:
+                continue
+
+            self.images[path] = ctk.CTkImage(light_image=image, dark_image=image, size=image.size)
+            while len(self.images) > self.MEMORY_CACHE_SIZE:
+                self.images.popitem(last=False)
+
+            for cell in self.cells:
+                if cell.entry is not None and cell.entry["path"] == path:
+                    cell.image_label.configure(image=self.images[path], text="")
+
+        self.window.after(self.RESULT_POLL_MS, self._drain_results)
+
+    def _on_scrollbar(self, *args):
+        """Handle scrollbar drags and arrow clicks"""
+        content_height = math.ceil(len(self.entries) / self.COLUMNS) * self.CELL_HEIGHT
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * content_height)
+        elif args[0] == "scroll":
+            step = self.CELL_HEIGHT if args[2] == "units" else self.viewport.winfo_height()
+            self.offset += int(args[1]) * step
+        self._layout()
+
+    def _on_mousewheel(self, event):
+        """Scroll by a third of a row per wheel notch"""
+        self.offset -= int(event.delta / 120 * self.CELL_HEIGHT / 3)
+        self._layout()
+
+    def _select(self, entry):
+        """Set the clicked entry as wallpaper"""
+        if entry is None:
+            return
+        self.app.set_wallpaper_from_date(entry["date"])
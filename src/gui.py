@@ -7,6 +7,7 @@ import threading
 from PIL import Image, ImageDraw, ImageFont
 import io
 import os
+from datetime import datetime
 
 
 # Set appearance mode and color theme
@@ -276,6 +277,109 @@ class UnsupportedOSWindow:
         parent.deiconify()
         dialog.wait_window()
 
+class CatalogSearchDialog:
+    MAX_RESULTS = 50
+
+    def __init__(self, catalog, parent, on_select):
+        self.catalog = catalog
+        self.parent = parent
+        self.on_select = on_select
+
+    def show(self):
+        """Show a search window over the local APOD catalog"""
+        dialog = ctk.CTkToplevel(self.parent)
+        dialog.title("APODPaper - Set Wallpaper From...")
+        dialog.geometry("550x500")
+        dialog.configure(fg_color=Theme.SPACE_BLACK)
+
+        WindowUtils.set_window_icon(dialog)
+
+        dialog.grid_columnconfigure(0, weight=1)
+        dialog.grid_rowconfigure(2, weight=1)
+
+        # Search bar
+        search_frame = ctk.CTkFrame(dialog, fg_color="transparent")
+        search_frame.grid(row=0, column=0, sticky="ew", padx=20, pady=(20, 10))
+        search_frame.grid_columnconfigure(0, weight=1)
+
+        search_entry = ctk.CTkEntry(
+            search_frame,
+            placeholder_text="Search titles and descriptions, or enter a date (YYYY-MM-DD)",
+            height=36,
+            font=ctk.CTkFont(size=12),
+            border_color=Theme.ACCENT,
+            fg_color=Theme.SECONDARY
+        )
+        search_entry.grid(row=0, column=0, sticky="ew", padx=(0, 10))
+
+        status_label = ctk.CTkLabel(
+            dialog,
+            text=f"{self.catalog.count('image')} images in the local catalog",
+            font=ctk.CTkFont(size=11),
+            text_color=Theme.TEXT
+        )
+        status_label.grid(row=1, column=0, sticky="w", padx=20)
+
+        results_frame = ctk.CTkScrollableFrame(dialog, fg_color=Theme.SECONDARY)
+        results_frame.grid(row=2, column=0, sticky="nsew", padx=20, pady=(5, 20))
+        results_frame.grid_columnconfigure(0, weight=1)
+
+        def select(date):
+            self.on_select(date)
+            dialog.destroy()
+
+        def search():
+            query = search_entry.get().strip()
+            for widget in results_frame.winfo_children():
+                widget.destroy()
+            if not query:
+                return
+
+            results = self.catalog.search(query, media_type="image", limit=self.MAX_RESULTS)
+            try:
+                datetime.strptime(query, "%Y-%m-%d")
+                # Dates not in the catalog yet can still be fetched
+                if not any(entry["date"] == query for entry in results):
+                    results.insert(0, self.catalog.get(query) or {"date": query, "title": "(not in catalog yet)"})
+            except ValueError:
+                pass
+
+            status_label.configure(text=f"{len(results)} result(s)")
+            for row, entry in enumerate(results):
+                button = ctk.CTkButton(
+                    results_frame,
+                    text=f"{entry['date']}  —  {entry.get('title', '')}",
+                    anchor="w",
+                    command=lambda date=entry["date"]: select(date),
+                    fg_color="transparent",
+                    hover_color=Theme.DARK_BLUE,
+                    text_color=Theme.TEXT
+                )
+                button.grid(row=row, column=0, sticky="ew", pady=1)
+
+        search_button = ctk.CTkButton(
+            search_frame,
+            text="Search",
+            command=search,
+            fg_color=Theme.ACCENT,
+            hover_color=Theme.ACCENT_HOVER,
+            width=80
+        )
+        search_button.grid(row=0, column=1)
+
+        dialog.bind('<Return>', lambda e: search())
+        dialog.bind('<Escape>', lambda e: dialog.destroy())
+
+        # Center window
+        dialog.update_idletasks()
+        x = (dialog.winfo_screenwidth() // 2) - (dialog.winfo_width() // 2)
+        y = (dialog.winfo_screenheight() // 2) - (dialog.winfo_height() // 2)
+        dialog.geometry(f"+{x}+{y}")
+
+        search_entry.focus_set()
+        dialog.lift()
+        return dialog
+
 def create_emoji_image(emoji_text, size=100):
     # Create a larger canvas to avoid clipping
     canvas_size = int(size * 1.4)  # Increased buffer for better centering
@@ -432,9 +536,77 @@ def show_info(parent, title, message, icon_type):
     
     dialog.focus_set()
     dialog.lift()
-    
+
     return dialog
 
+def show_toast(parent, title, message, icon_type, duration=5000):
+    """Show a non-modal toast in the bottom-right corner that closes itself"""
+    title = str(title)
+    message = str(message)
+    icon_type = str(icon_type).lower()
+
+    icon_map = {
+        "success": "✅",
+        "warning": "⚠️",
+        "error": "❌",
+        "gear": "⚙️"
+    }
+    emoji = icon_map.get(icon_type, "ℹ️")
+
+    toast = ctk.CTkToplevel(parent)
+    toast.overrideredirect(True)
+    toast.attributes("-topmost", True)
+    toast.configure(fg_color=Theme.SECONDARY)
+
+    main_frame = ctk.CTkFrame(toast, fg_color="transparent")
+    main_frame.pack(fill="both", expand=True, padx=15, pady=12)
+    main_frame.grid_columnconfigure(1, weight=1)
+
+    icon_size = 32
+    icon_img = ctk.CTkImage(
+        light_image=create_emoji_image(emoji, size=icon_size),
+        size=(icon_size, icon_size)
+    )
+    icon_label = ctk.CTkLabel(main_frame, image=icon_img, text="", fg_color="transparent")
+    icon_label.grid(row=0, column=0, rowspan=2, padx=(0, 12), sticky="n")
+
+    title_label = ctk.CTkLabel(
+        main_frame,
+        text=title,
+        font=ctk.CTkFont(size=13, weight="bold"),
+        text_color=Theme.ACCENT_HOVER,
+        anchor="w"
+    )
+    title_label.grid(row=0, column=1, sticky="w")
+
+    message_label = ctk.CTkLabel(
+        main_frame,
+        text=message,
+        font=ctk.CTkFont(size=12),
+        text_color=Theme.TEXT,
+        wraplength=260,
+        justify="left",
+        anchor="w"
+    )
+    message_label.grid(row=1, column=1, sticky="w")
+
+    def close(event=None):
+        if toast.winfo_exists():
+            toast.destroy()
+
+    # Click anywhere on the toast to dismiss it early
+    for widget in (toast, main_frame, icon_label, title_label, message_label):
+        widget.bind("<Button-1>", close)
+
+    # Place above the taskbar in the bottom-right corner
+    toast.update_idletasks()
+    x = toast.winfo_screenwidth() - toast.winfo_reqwidth() - 20
+    y = toast.winfo_screenheight() - toast.winfo_reqheight() - 60
+    toast.geometry(f"+{x}+{y}")
+
+    toast.after(duration, close)
+    return toast
+
 if __name__ == "__main__":
     root = ctk.CTk()
     root.geometry("500x500")
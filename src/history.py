@@ -0,0 +1,139 @@
+"""
+Journal of applied wallpapers, for stepping back and forth without the network
+"""
+import os
+import json
+import threading
+from collections import deque
+from datetime import datetime
+
+
+def fingerprint(path):
+    """Cheap identity of a file's contents (size and modification time)"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+class WallpaperHistory:
+    def __init__(self, apod_folder, max_entries=200):
+        self.path = os.path.join(apod_folder, "history.jsonl")
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=max_entries)
+        # Index into _entries of the wallpaper currently on screen
+        self._cursor = -1
+        self._lines = 0
+        # (size, mtime) of the journal as last read or written here; a
+        # difference means another process (the CLI) wrote to it since
+        self._file_state = None
+        with self._lock:
+            self._reload()
+
+    def _stat_file(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _reload(self):
+        """Read the journal, skipping a line torn by a crash mid-write; caller holds the lock"""
+        self._entries.clear()
+        self._lines = 0
+        torn = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._lines += 1
+                    torn = not line.endswith("\n")
+                    try:
+                        self._entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+
+        self._cursor = len(self._entries) - 1
+        self._file_state = self._stat_file()
+        # Rewrite a torn journal so the next append doesn't land on the broken line
+        if torn or self._lines > 2 * self.max_entries:
+            self._compact()
+
+    def _refresh(self):
+        """Pick up entries other processes appended; caller holds the lock"""
+        if self._stat_file() != self._file_state:
+            self._reload()
+
+    def _compact(self):
+        """Rewrite the journal with just the in-memory entries; caller holds the lock"""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry in self._entries:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self._lines = len(self._entries)
+        self._file_state = self._stat_file()
+
+    def record(self, path, date=None, source="update"):
+        """Append an applied wallpaper to the journal"""
+        entry = {
+            "path": path,
+            "date": date,
+            "source": source,
+            "fingerprint": fingerprint(path),
+            "applied_at": datetime.now().isoformat(timespec="seconds")
+        }
+
+        with self._lock:
+            # Compaction below must not drop what the CLI appended meanwhile
+            self._refresh()
+
+            # Re-applying the same image (hourly checks, ...) isn't a new step
+            last = self._entries[-1] if self._entries else None
+            if last and last["path"] == path and last["fingerprint"] == entry["fingerprint"]:
+                self._cursor = len(self._entries) - 1
+                return
+
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._file_state = self._stat_file()
+            self._lines += 1
+            self._entries.append(entry)
+            self._cursor = len(self._entries) - 1
+
+            if self._lines > 2 * self.max_entries:
+                self._compact()
+
+    def previous(self):
+        """Step back to the previous wallpaper still on disk, or None"""
+        return self._step(-1)
+
+    def next(self):
+        """Step forward again after going back, or None"""
+        return self._step(1)
+
+    def _step(self, direction):
+        with self._lock:
+            self._refresh()
+            current = self._entries[self._cursor]["path"] if self._cursor >= 0 else None
+            index = self._cursor + direction
+            while 0 <= index < len(self._entries):
+                entry = self._entries[index]
+                if entry["path"] != current and os.path.exists(entry["path"]):
+                    self._cursor = index
+                    return entry
+                index += direction
+        return None
+
+    def entries(self):
+        """Get the remembered wallpapers, oldest first"""
+        with self._lock:
+            self._refresh()
+            return list(self._entries)
@@ -0,0 +1,89 @@
+"""
+Cheap image dimension probing from the first bytes of a file
+"""
+import struct
+import requests
+
+
+# Enough for the header of practically every JPEG, including large EXIF blocks
+PROBE_BYTES = 64 * 1024
+
+
+def parse_dimensions(data):
+    """Get (width, height) from the start of a JPEG, PNG or GIF file
+
+    Returns None if the format is unknown or the header is incomplete.
+    """
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24 and data[12:16] == b"IHDR":
+        return struct.unpack(">II", data[16:24])
+
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+
+    if data[:2] == b"\xff\xd8":
+        return _parse_jpeg_dimensions(data)
+
+    return None
+
+
+def _parse_jpeg_dimensions(data):
+    """Walk JPEG segments until the start-of-frame marker"""
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+
+        # Fill bytes and standalone markers carry no length field
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            return None
+
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if i + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def probe_dimensions(url, timeout=10):
+    """Get an image's (width, height) by fetching only its first bytes"""
+    headers = {"Range": f"bytes=0-{PROBE_BYTES - 1}"}
+    data = b""
+    # Servers that ignore Range still only get read up to PROBE_BYTES
+    with requests.get(url, headers=headers, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(8192):
+            data += chunk
+            dimensions = parse_dimensions(data)
+            if dimensions or len(data) >= PROBE_BYTES:
+                return dimensions
+    return parse_dimensions(data)
+
+
+class ImageFilter:
+    def __init__(self, min_width=0, min_height=0, min_aspect=None, max_aspect=None):
+        self.min_width = min_width
+        self.min_height = min_height
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+
+    def accepts(self, width, height):
+        """Check if an image of this size makes a usable wallpaper"""
+        if width < self.min_width or height < self.min_height or height == 0:
+            return False
+        aspect = width / height
+        if self.min_aspect is not None and aspect < self.min_aspect:
+            return False
+        if self.max_aspect is not None and aspect > self.max_aspect:
+            return False
+        return True
@@ -0,0 +1,266 @@
+"""
+Content-addressed storage for downloaded APOD images
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import requests
+
+try:
+    from .bandwidth import BandwidthEstimator, TokenBucket
+except ImportError:
+    from bandwidth import BandwidthEstimator, TokenBucket
+
+
+def response_validators(response):
+    """Get the cache validators (ETag, Last-Modified) a response came with"""
+    validators = {}
+    if response.headers.get("ETag"):
+        validators["etag"] = response.headers["ETag"]
+    if response.headers.get("Last-Modified"):
+        validators["last_modified"] = response.headers["Last-Modified"]
+    return validators
+
+
+def conditional_headers(validators):
+    """Get request headers that let the server answer 304 if nothing changed"""
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+class ImageStore:
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, apod_folder):
+        self.apod_folder = apod_folder
+        self.blobs_folder = os.path.join(apod_folder, "blobs")
+        self.index_path = os.path.join(self.blobs_folder, "index.json")
+        self._lock = threading.Lock()
+        self._url_locks = {}
+        os.makedirs(self.blobs_folder, exist_ok=True)
+        self._index = self._load_index()
+        self.bandwidth = BandwidthEstimator(self._index.get("bandwidth"))
+        self._throttle = None
+
+    def _load_index(self):
+        """Load the URL -> blob index and each URL's cache validators"""
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {"urls": {}}
+        # Indexes written before validators were kept don't have them
+        index.setdefault("validators", {})
+        return index
+
+    def _save_index(self):
+        """Persist the URL -> blob index; caller holds the lock"""
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(temp_path, self.index_path)
+
+    def set_rate_limit(self, bytes_per_second):
+        """Cap the combined download rate of every fetch; None for no cap"""
+        self._throttle = TokenBucket(bytes_per_second) if bytes_per_second else None
+
+    def blob_path(self, digest, ext=""):
+        """Get the path a blob with this SHA-256 digest is stored at"""
+        return os.path.join(self.blobs_folder, digest[:2], f"{digest}{ext.lower()}")
+
+    def find_url(self, url):
+        """Get the blob already downloaded from a URL, if any"""
+        with self._lock:
+            blob_name = self._index["urls"].get(url)
+        if not blob_name:
+            return None
+        path = self.blob_path(*os.path.splitext(blob_name))
+        return path if os.path.exists(path) else None
+
+    def has_digest(self, digest, ext=""):
+        """Check if a blob with this digest is already stored"""
+        return os.path.exists(self.blob_path(digest, ext))
+
+    def _remember_url(self, url, blob_path, validators):
+        with self._lock:
+            self._index["urls"][url] = os.path.basename(blob_path)
+            self._index["validators"][url] = dict(validators, checked=time.time())
+            # Remembered so quality choices are informed right after a restart
+            self._index["bandwidth"] = self.bandwidth.estimate()
+            self._save_index()
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def fetch(self, url, timeout=60):
+        """Download a URL into the store and return its blob path
+
+        The body is hashed while it streams to disk, and a URL that was
+        fetched before is never downloaded again.
+        """
+        # Concurrent fetches of one URL wait for the first instead of racing it
+        with self._url_lock(url):
+            existing = self.find_url(url)
+            if existing:
+                return existing
+            return self._download(url, timeout)
+
+    def revalidate(self, url, timeout=60):
+        """Check a stored URL for changes with a conditional GET
+
+        Returns (blob_path, changed). An unchanged image costs a 304 with no
+        body; a changed one is downloaded into a new blob.
+        """
+        with self._url_lock(url):
+            existing = self.find_url(url)
+            if not existing:
+                return self._download(url, timeout), True
+
+            with self._lock:
+                validators = self._index["validators"].get(url)
+            blob_path = self._download(url, timeout, conditional_headers(validators))
+            if blob_path is None:
+                with self._lock:
+                    self._index["validators"].setdefault(url, {})["checked"] = time.time()
+                    self._save_index()
+                return existing, False
+            return blob_path, blob_path != existing
+
+    def _download(self, url, timeout, headers=None):
+        """Stream a URL into the store; returns None if the server says 304 Not Modified"""
+        ext = os.path.splitext(url.split("?")[0])[1]
+        hasher = hashlib.sha256()
+        temp_path = os.path.join(self.blobs_folder, f"download_{threading.get_ident()}.part")
+
+        throttle = self._throttle
+        started = time.monotonic()
+        byte_count = 0
+        with requests.get(url, timeout=timeout, stream=True, headers=headers) as response:
+            if response.status_code == 304:
+                return None
+            response.raise_for_status()
+            with open(temp_path, "wb") as f:
+                for chunk in response.iter_content(self.CHUNK_SIZE):
+                    if throttle:
+                        throttle.consume(len(chunk))
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    byte_count += len(chunk)
+            validators = response_validators(response)
+        self.bandwidth.add_sample(byte_count, time.monotonic() - started)
+
+        blob_path = self._commit(temp_path, hasher.hexdigest(), ext)
+        self._remember_url(url, blob_path, validators)
+        return blob_path
+
+    def add_file(self, path, ext=None):
+        """Move an existing file into the store and return its blob path"""
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        if ext is None:
+            ext = os.path.splitext(path)[1]
+        return self._commit(path, hasher.hexdigest(), ext)
+
+    def add_stream(self, fileobj, ext="", digest=None):
+        """Copy a file object into the store and return its blob path
+
+        If the expected digest is given, content that doesn't match it is
+        rejected with a ValueError instead of being stored.
+        """
+        hasher = hashlib.sha256()
+        temp_path = os.path.join(self.blobs_folder, f"import_{threading.get_ident()}.part")
+        with open(temp_path, "wb") as f:
+            for chunk in iter(lambda: fileobj.read(self.CHUNK_SIZE), b""):
+                hasher.update(chunk)
+                f.write(chunk)
+        if digest and hasher.hexdigest() != digest:
+            os.remove(temp_path)
+            raise ValueError(f"content doesn't match its digest {digest}")
+        return self._commit(temp_path, hasher.hexdigest(), ext)
+
+    def urls(self):
+        """Get a copy of the URL -> blob name index"""
+        with self._lock:
+            return dict(self._index["urls"])
+
+    def add_urls(self, urls):
+        """Remember where stored blobs came from, keeping URLs already known
+
+        Returns how many URLs were added.
+        """
+        with self._lock:
+            added = {
+                url: blob_name for url, blob_name in urls.items()
+                if url not in self._index["urls"] and os.path.exists(self.blob_path(*os.path.splitext(blob_name)))
+            }
+            if added:
+                self._index["urls"].update(added)
+                self._save_index()
+        return len(added)
+
+    def _commit(self, temp_path, digest, ext):
+        """Move a hashed file to its blob path, dropping it if already stored"""
+        blob_path = self.blob_path(digest, ext)
+        if os.path.exists(blob_path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(temp_path, blob_path)
+        return blob_path
+
+    def link(self, blob_path, name_path):
+        """Make name_path refer to a blob, as a hardlink where possible"""
+        if os.path.exists(name_path):
+            if os.path.samefile(blob_path, name_path):
+                return name_path
+            os.remove(name_path)
+        try:
+            os.link(blob_path, name_path)
+        except OSError:
+            # Filesystems without hardlinks (e.g. FAT) get a plain copy
+            shutil.copyfile(blob_path, name_path)
+        return name_path
+
+    def clear(self):
+        """Delete every stored blob and the URL index"""
+        with self._lock:
+            shutil.rmtree(self.blobs_folder, ignore_errors=True)
+            os.makedirs(self.blobs_folder, exist_ok=True)
+            self._index = {"urls": {}, "validators": {}}
+
+    def clean_library(self):
+        """Delete all saved images, their blobs, thumbnails and derivatives; returns how many images were removed"""
+        extensions = ["png", "jpg", "jpeg", "gif"]
+
+        removed = 0
+        for filename in os.listdir(self.apod_folder):
+            ext = os.path.splitext(filename)[1].lstrip(".").lower()
+            if ext in extensions:
+                filepath = os.path.join(self.apod_folder, filename)
+                try:
+                    os.remove(filepath)
+                    removed += 1
+                    print(f"removed {filepath}")
+                except OSError as e:
+                    print(f"error removing file {filepath}: {e}")
+
+        # Scaled copies would otherwise outlive their images (and rotation would keep using them)
+        for folder in ("thumbnails", "derivatives"):
+            folder_path = os.path.join(self.apod_folder, folder)
+            if os.path.isdir(folder_path):
+                shutil.rmtree(folder_path, ignore_errors=True)
+                os.makedirs(folder_path, exist_ok=True)
+
+        # The named images above were links into the store
+        self.clear()
+        return removed
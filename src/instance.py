@@ -0,0 +1,124 @@
+"""
+Single-instance lock and local command channel for APODPaper
+
+The first tray app to start holds an OS file lock and listens on a
+localhost socket. Later launches (and the CLI) find it through
+instance.json and forward their command instead of doing the work twice.
+"""
+import os
+import sys
+import json
+import time
+import hmac
+import socket
+import secrets
+import threading
+import socketserver
+
+
+class SingleInstance:
+    def __init__(self, apod_folder):
+        self.lock_path = os.path.join(apod_folder, "instance.lock")
+        self.info_path = os.path.join(apod_folder, "instance.json")
+        self._lock_file = None
+        self._server = None
+
+    def acquire(self):
+        """Try to become the running instance; False if another one already is
+
+        The OS drops the lock when the process exits, even on a crash, so a
+        stale lock never blocks the next launch.
+        """
+        lock_file = open(self.lock_path, "a+")
+        try:
+            if sys.platform == "win32":
+                import msvcrt
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        self._lock_file = lock_file
+        return True
+
+    def serve(self, handler):
+        """Accept forwarded commands on a background thread
+
+        handler(command, args) returns a JSON-serializable reply.
+        """
+        token = secrets.token_hex(16)
+        server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), CommandRequestHandler)
+        server.daemon_threads = True
+        server.token = token
+        server.handler = handler
+        self._server = server
+
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        # Only published once the server is accepting, so clients never race it
+        info = {"pid": os.getpid(), "port": server.server_address[1], "token": token}
+        temp_path = self.info_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(info, f)
+        os.replace(temp_path, self.info_path)
+
+    def release(self):
+        """Stop serving and give up the lock"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            try:
+                os.remove(self.info_path)
+            except OSError:
+                pass
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class CommandRequestHandler(socketserver.StreamRequestHandler):
+    # Requests are a single small JSON line
+    MAX_REQUEST_BYTES = 64 * 1024
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline(self.MAX_REQUEST_BYTES))
+            if not hmac.compare_digest(str(request.get("token", "")), self.server.token):
+                reply = {"ok": False, "error": "Invalid token"}
+            else:
+                reply = self.server.handler(request.get("command"), request.get("args") or {})
+        except Exception as e:
+            reply = {"ok": False, "error": str(e)}
+        self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+
+def send_command(apod_folder, command, timeout=5, **args):
+    """Forward a command to the running instance
+
+    Returns the instance's reply, or None if no instance is reachable.
+    """
+    try:
+        with open(os.path.join(apod_folder, "instance.json"), "r") as f:
+            info = json.load(f)
+        with socket.create_connection(("127.0.0.1", info["port"]), timeout=timeout) as conn:
+            request = {"token": info["token"], "command": command, "args": args}
+            conn.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with conn.makefile("rb") as reply:
+                return json.loads(reply.readline())
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def forward_to_running_instance(apod_folder, command, wait=3, **args):
+    """Forward a command from a second launch, giving a starting instance time to listen"""
+    deadline = time.monotonic() + wait
+    while True:
+        reply = send_command(apod_folder, command, **args)
+        if reply is not None or time.monotonic() >= deadline:
+            return reply
+        time.sleep(0.25)
@@ -0,0 +1,276 @@
+"""
+Export and import of the local library as one streaming archive
+
+A bundle is an uncompressed tar (the images are compressed already) that
+starts with a manifest, followed by the catalog, the feature index, every
+image blob once and the thumbnails and derivatives. Both directions read
+and write it strictly front to back, so a bundle can be piped and moves at
+disk speed without any API calls.
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import tarfile
+import tempfile
+import posixpath
+
+try:
+    from .apod_client import IMAGE_NAME_PATTERN
+except ImportError:
+    from apod_client import IMAGE_NAME_PATTERN
+
+
+FORMAT = "apodpaper-library"
+VERSION = 1
+
+MANIFEST_NAME = "manifest.json"
+CATALOG_NAME = "catalog.jsonl"
+FEATURES_NAME = "features.jsonl"
+
+# Folders of the data folder a bundle carries, and the only places import writes to
+EXTRA_FOLDERS = ("thumbnails", "derivatives")
+
+BLOB_NAME_PATTERN = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]{1,5})?$")
+
+# Large buffers keep reads and writes sequential
+BUFFER_SIZE = 1024 * 1024
+
+# Catalog rows inserted per transaction during import
+CATALOG_BATCH = 500
+
+
+class LibraryBundle:
+    def __init__(self, apod_folder, catalog, image_store):
+        self.apod_folder = apod_folder
+        self.catalog = catalog
+        self.image_store = image_store
+
+    def _library_images(self):
+        """Get the wallpaper images in the data folder, sorted by name"""
+        return sorted(name for name in os.listdir(self.apod_folder) if IMAGE_NAME_PATTERN.match(name))
+
+    def _stored_blobs(self):
+        """Map the (device, inode) of every stored blob to its file name"""
+        blobs = {}
+        for folder, _, files in os.walk(self.image_store.blobs_folder):
+            for name in files:
+                if BLOB_NAME_PATTERN.match(name):
+                    stat = os.stat(os.path.join(folder, name))
+                    blobs[(stat.st_dev, stat.st_ino)] = name
+        return blobs
+
+    def _blob_name_for(self, path, stored_blobs):
+        """Get the content-addressed name of an image, hashing it only if it isn't hardlinked to a blob"""
+        stat = os.stat(path)
+        name = stored_blobs.get((stat.st_dev, stat.st_ino))
+        if name:
+            return name
+
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(BUFFER_SIZE), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest() + os.path.splitext(path)[1].lower()
+
+    def export_to(self, path, derivatives=True):
+        """Write the library to a bundle ("-" for stdout) and return what was written"""
+        stored_blobs = self._stored_blobs()
+        images = []
+        blob_sources = {}
+        for name in self._library_images():
+            image_path = os.path.join(self.apod_folder, name)
+            blob_name = self._blob_name_for(image_path, stored_blobs)
+            images.append({"name": name, "blob": blob_name})
+            blob_sources.setdefault(blob_name, image_path)
+
+        known_blobs = set(blob_sources)
+        manifest = {
+            "format": FORMAT,
+            "version": VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "images": images,
+            # Lets the importing side recognize these images instead of downloading them again
+            "urls": {url: blob for url, blob in self.image_store.urls().items() if blob in known_blobs}
+        }
+
+        folders = EXTRA_FOLDERS if derivatives else EXTRA_FOLDERS[:1]
+        stats = {"images": len(images), "blobs": len(blob_sources), "entries": 0, "files": 0}
+
+        if path == "-":
+            archive = tarfile.open(fileobj=sys.stdout.buffer, mode="w|", bufsize=BUFFER_SIZE)
+        else:
+            archive = tarfile.open(path, "w|", bufsize=BUFFER_SIZE)
+        with archive:
+            # The manifest goes first so import knows what follows before reading it
+            self._add_bytes(archive, MANIFEST_NAME, json.dumps(manifest, indent=1).encode("utf-8"))
+
+            with tempfile.TemporaryFile() as spool:
+                for entry in self.catalog.iter_entries():
+                    spool.write(json.dumps(entry).encode("utf-8") + b"\n")
+                    stats["entries"] += 1
+                self._add_spooled(archive, CATALOG_NAME, spool)
+
+            with tempfile.TemporaryFile() as spool:
+                for row in self.catalog.all_features():
+                    # Paths are machine specific; the importing side puts its own folder back
+                    row["path"] = os.path.basename(row["path"])
+                    spool.write(json.dumps(row).encode("utf-8") + b"\n")
+                self._add_spooled(archive, FEATURES_NAME, spool)
+
+            for blob_name, source_path in blob_sources.items():
+                archive.add(source_path, arcname=f"blobs/{blob_name}", recursive=False)
+
+            for folder in folders:
+                folder_path = os.path.join(self.apod_folder, folder)
+                if not os.path.isdir(folder_path):
+                    continue
+                for name in sorted(os.listdir(folder_path)):
+                    file_path = os.path.join(folder_path, name)
+                    if os.path.isfile(file_path) and not name.endswith(".part"):
+                        archive.add(file_path, arcname=f"{folder}/{name}", recursive=False)
+                        stats["files"] += 1
+        return stats
+
+    def _add_bytes(self, archive, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        archive.addfile(info, io.BytesIO(data))
+
+    def _add_spooled(self, archive, name, spool):
+        """Add a temporary file; spooled first because a streamed tar needs each size up front"""
+        info = tarfile.TarInfo(name)
+        info.size = spool.tell()
+        info.mtime = int(time.time())
+        spool.seek(0)
+        archive.addfile(info, spool)
+
+    def import_from(self, path):
+        """Merge a bundle ("-" for stdin) into the library and return what was added
+
+        Blobs already stored (by content hash), catalog dates already known and
+        files already present are skipped, so importing the same bundle twice
+        adds nothing the second time.
+        """
+        stats = {"blobs": 0, "blobs_skipped": 0, "images": 0, "entries": 0, "files": 0}
+
+        if path == "-":
+            archive = tarfile.open(fileobj=sys.stdin.buffer, mode="r|*", bufsize=BUFFER_SIZE)
+        else:
+            archive = tarfile.open(path, "r|*", bufsize=BUFFER_SIZE)
+
+        manifest = None
+        features = []
+        with archive:
+            for member in archive:
+                name = posixpath.normpath(member.name)
+                if manifest is None:
+                    if name != MANIFEST_NAME or not member.isfile():
+                        raise ValueError("not an APODPaper library bundle (no manifest)")
+                    manifest = json.load(archive.extractfile(member))
+                    if manifest.get("format") != FORMAT or manifest.get("version", 0) > VERSION:
+                        raise ValueError("unsupported library bundle format")
+                    continue
+
+                if not member.isfile():
+                    continue
+                if name == CATALOG_NAME:
+                    stats["entries"] += self._import_catalog(archive.extractfile(member))
+                elif name == FEATURES_NAME:
+                    features = [json.loads(line) for line in archive.extractfile(member) if line.strip()]
+                elif name.startswith("blobs/"):
+                    if self._import_blob(name[len("blobs/"):], archive.extractfile(member)):
+                        stats["blobs"] += 1
+                    else:
+                        stats["blobs_skipped"] += 1
+                elif self._import_file(name, archive.extractfile(member)):
+                    stats["files"] += 1
+
+        if manifest is None:
+            raise ValueError("empty library bundle")
+
+        # Names are linked only now that every blob they could refer to is in the store
+        imported_paths = []
+        for image in manifest.get("images", []):
+            name, blob_name = image.get("name", ""), image.get("blob", "")
+            blob_match = BLOB_NAME_PATTERN.match(blob_name)
+            if not IMAGE_NAME_PATTERN.match(name) or not blob_match:
+                continue
+            image_path = os.path.join(self.apod_folder, name)
+            blob_path = self.image_store.blob_path(blob_match.group(1), blob_match.group(2) or "")
+            if os.path.exists(image_path) or not os.path.exists(blob_path):
+                continue
+            self.image_store.link(blob_path, image_path)
+            imported_paths.append(image_path)
+            stats["images"] += 1
+
+        self.image_store.add_urls({
+            url: blob for url, blob in manifest.get("urls", {}).items() if BLOB_NAME_PATTERN.match(blob)
+        })
+        self._import_features(features)
+        return stats
+
+    def _import_catalog(self, fileobj):
+        """Add catalog entries for dates not cataloged yet; returns how many were new"""
+        added = 0
+        batch = []
+        for line in fileobj:
+            if line.strip():
+                batch.append(json.loads(line))
+            if len(batch) >= CATALOG_BATCH:
+                added += self.catalog.add_many(batch, replace=False)
+                batch = []
+        if batch:
+            added += self.catalog.add_many(batch, replace=False)
+        return added
+
+    def _import_blob(self, blob_name, fileobj):
+        """Store a blob unless one with the same hash is already there; returns whether it was stored"""
+        match = BLOB_NAME_PATTERN.match(blob_name)
+        if not match:
+            print(f"Skipping unexpected bundle member blobs/{blob_name}")
+            return False
+        digest, ext = match.group(1), match.group(2) or ""
+        if self.image_store.has_digest(digest, ext):
+            # The unread data is skipped over by the tar reader
+            return False
+        self.image_store.add_stream(fileobj, ext, digest)
+        return True
+
+    def _import_file(self, name, fileobj):
+        """Write a thumbnail or derivative unless it exists; returns whether it was written"""
+        folder, _, file_name = name.partition("/")
+        # Only plain names directly inside the known folders, never anything that escapes them
+        if folder not in EXTRA_FOLDERS or not file_name or "/" in file_name or file_name.startswith("."):
+            print(f"Skipping unexpected bundle member {name}")
+            return False
+
+        folder_path = os.path.join(self.apod_folder, folder)
+        file_path = os.path.join(folder_path, file_name)
+        if os.path.exists(file_path):
+            return False
+
+        os.makedirs(folder_path, exist_ok=True)
+        partial_path = file_path + ".part"
+        with open(partial_path, "wb") as f:
+            for chunk in iter(lambda: fileobj.read(BUFFER_SIZE), b""):
+                f.write(chunk)
+        os.replace(partial_path, file_path)
+        return True
+
+    def _import_features(self, rows):
+        """Index features of images that aren't indexed here yet"""
+        indexed = {os.path.basename(row["path"]) for row in self.catalog.all_features()}
+        new_rows = []
+        for row in rows:
+            name = os.path.basename(row.get("path", ""))
+            image_path = os.path.join(self.apod_folder, name)
+            if name in indexed or not IMAGE_NAME_PATTERN.match(name) or not os.path.exists(image_path):
+                continue
+            new_rows.append(dict(row, path=image_path, mtime=os.path.getmtime(image_path)))
+        self.catalog.add_features_many(new_rows)
+
@@ -0,0 +1,110 @@
+"""
+Memory measurement and idle trimming for the long-running tray process
+"""
+import gc
+import os
+import sys
+import ctypes
+
+
+class _ProcessMemoryCounters(ctypes.Structure):
+    _fields_ = [
+        ("cb", ctypes.c_ulong),
+        ("PageFaultCount", ctypes.c_ulong),
+        ("PeakWorkingSetSize", ctypes.c_size_t),
+        ("WorkingSetSize", ctypes.c_size_t),
+        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+        ("PagefileUsage", ctypes.c_size_t),
+        ("PeakPagefileUsage", ctypes.c_size_t),
+    ]
+
+
+def get_private_usage():
+    """Get the memory the process itself holds (private bytes on Windows) in bytes, or None
+
+    Unlike the working set this doesn't drop when the OS pages memory out,
+    so it says whether a trim really gave anything back.
+    """
+    try:
+        if sys.platform == "win32":
+            counters = _ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.PagefileUsage
+            return None
+        with open("/proc/self/statm", "r") as f:
+            fields = f.read().split()
+        # Resident pages minus those shared with other processes (libraries, ...)
+        return (int(fields[1]) - int(fields[2])) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+
+def release_to_os(empty_working_set=False):
+    """Give freed heap memory back to the OS
+
+    empty_working_set also pages out the whole working set on Windows. The
+    pages come straight back on the next activity, so only do that when the
+    process is about to sit idle.
+    """
+    try:
+        if sys.platform == "win32":
+            if empty_working_set:
+                process = ctypes.windll.kernel32.GetCurrentProcess()
+                ctypes.windll.kernel32.SetProcessWorkingSetSize(process, ctypes.c_size_t(-1), ctypes.c_size_t(-1))
+        elif sys.platform.startswith("linux"):
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except Exception:
+        pass
+
+
+class MemoryManager:
+    def __init__(self, app_controller):
+        self.app = app_controller
+        self.last_usage = None
+
+    def trim(self, reason="", idle=False):
+        """Drop caches and garbage, then give freed memory back to the OS
+
+        With idle=True (nothing left to do for now) the working set is emptied as well.
+        """
+        before = get_private_usage()
+        gc.collect()
+        if self.app.catalog is not None:
+            self.app.catalog.shrink_memory()
+        release_to_os(empty_working_set=idle and not self.app.update_coordinator.is_busy())
+        self.last_usage = get_private_usage()
+
+        if before and self.last_usage:
+            label = f" after {reason}" if reason else ""
+            print(f"Memory trimmed{label}: {before / 2**20:.1f} MB -> {self.last_usage / 2**20:.1f} MB")
+        return self.last_usage
+
+    def check(self):
+        """Trim if the process has grown past the configured ceiling"""
+        usage = get_private_usage()
+        ceiling = self.app.config.get_memory_ceiling_mb() * 2**20
+        if usage and usage > ceiling:
+            usage = self.trim("exceeding the memory ceiling")
+            if usage and usage > ceiling:
+                print(f"Warning: using {usage / 2**20:.1f} MB, above the {ceiling / 2**20:.0f} MB ceiling")
+        return usage
+
+    def trim_after_close(self, window):
+        """Trim once a window (and everything it holds) is destroyed"""
+        def on_destroy(event):
+            # <Destroy> fires for every child widget too; only react to the window
+            if event.widget is window:
+                self.app.root.after_idle(lambda: self.trim("closing a window", idle=True))
+        window.bind("<Destroy>", on_destroy, add="+")
+
+    def describe(self):
+        """Human-readable current memory usage"""
+        usage = get_private_usage()
+        if usage is None:
+            return "Memory usage unavailable"
+        return f"Memory usage: {usage / 2**20:.1f} MB"
@@ -0,0 +1,65 @@
+"""
+Thread-safe notification queue for APODPaper
+"""
+import queue
+
+
+# Most severe first; a merged notification takes the icon of its most severe part
+SEVERITY = ("error", "warning", "success", "gear", "info")
+
+
+def merge(notifications):
+    """Combine drained (title, message, icon_type, count) notifications into one
+
+    Only one toast is visible at a time, so results drained together are
+    shown together instead of each replacing the one before.
+    """
+    lines = []
+    for title, message, icon_type, count in notifications:
+        if count > 1:
+            message = f"{message} (x{count})"
+        lines.append((title, message))
+
+    titles = {title for title, _ in lines}
+    if len(titles) == 1:
+        title = titles.pop()
+        message = "\n".join(line for _, line in lines)
+    else:
+        title = "APODPaper"
+        message = "\n".join(f"{line_title}: {line}" for line_title, line in lines)
+
+    icon_types = [icon_type for _, _, icon_type, _ in notifications]
+    icon_type = min(icon_types, key=lambda icon: SEVERITY.index(icon) if icon in SEVERITY else len(SEVERITY))
+    return title, message, icon_type
+
+
+class NotificationQueue:
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def post(self, title, message, icon_type="info"):
+        """Queue a notification from any thread"""
+        self._queue.put((str(title), str(message), str(icon_type).lower()))
+
+    def drain(self):
+        """Take all pending notifications, coalescing repeated ones
+
+        Returns a list of (title, message, icon_type, count) tuples in the
+        order they were last posted, so a burst of identical results shows
+        up once instead of once per click.
+        """
+        pending = {}
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            count = pending.pop(item, 0)
+            pending[item] = count + 1
+
+        return [(title, message, icon_type, count)
+                for (title, message, icon_type), count in pending.items()]
+
+    def empty(self):
+        """Check if there are no pending notifications"""
+        return self._queue.empty()
@@ -0,0 +1,133 @@
+"""
+Background prefetching of upcoming APOD images
+"""
+import os
+import ctypes
+import threading
+from datetime import datetime
+
+
+class _SystemPowerStatus(ctypes.Structure):
+    _fields_ = [
+        ("ACLineStatus", ctypes.c_ubyte),
+        ("BatteryFlag", ctypes.c_ubyte),
+        ("BatteryLifePercent", ctypes.c_ubyte),
+        ("SystemStatusFlag", ctypes.c_ubyte),
+        ("BatteryLifeTime", ctypes.c_ulong),
+        ("BatteryFullLifeTime", ctypes.c_ulong),
+    ]
+
+
+def is_on_battery():
+    """Check if the machine is running on battery or in battery saver mode"""
+    try:
+        status = _SystemPowerStatus()
+        if not ctypes.windll.kernel32.GetSystemPowerStatus(ctypes.byref(status)):
+            return False
+        # ACLineStatus 0 means unplugged; SystemStatusFlag 1 means battery saver
+        return status.ACLineStatus == 0 or status.SystemStatusFlag == 1
+    except Exception:
+        return False
+
+
+class Prefetcher:
+    def __init__(self, app_controller):
+        self.app = app_controller
+        self.paused = False
+        self._lock = threading.Lock()
+
+    def can_prefetch(self):
+        """Check if background downloads are currently allowed"""
+        config = self.app.config
+        if self.paused or not config.get_prefetch_enabled():
+            return False
+        if config.is_metered_connection():
+            return False
+        if is_on_battery() and not config.get_prefetch_on_battery():
+            return False
+        return self.app.apod_client is not None and self.app.apod_client.is_online()
+
+    def request_prefetch(self):
+        """Start a prefetch pass in the background unless one is running"""
+        if not self.can_prefetch():
+            return
+        threading.Thread(target=self.run_once, daemon=True).start()
+
+    def run_once(self):
+        """Prefetch today's image and the next random candidate"""
+        # Never queue up behind another pass; this is best-effort work
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            # Let user-visible updates have the connection to themselves
+            if self.app.update_coordinator.is_busy():
+                return
+
+            hd_enabled = self.app.config.get_hd_preference()
+            if self.app.config.get_random_image_preference():
+                self.prefetch_random(hd_enabled)
+            else:
+                self.prefetch_today(hd_enabled)
+        except Exception as e:
+            print(f"Prefetch failed: {e}")
+        finally:
+            self._lock.release()
+
+    def request_revalidation(self):
+        """Start a revalidation sweep in the background; same rules as prefetching"""
+        if not self.can_prefetch():
+            return
+        threading.Thread(target=self.revalidate_once, daemon=True).start()
+
+    def revalidate_once(self):
+        """Check the least recently checked part of the library for corrections"""
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self.app.update_coordinator.is_busy():
+                return
+            changed = self.app.apod_client.revalidate_library(**self.app.config.get_revalidation_settings())
+            if changed:
+                print(f"Revalidation refreshed {changed} entries")
+        except Exception as e:
+            print(f"Revalidation failed: {e}")
+        finally:
+            self._lock.release()
+
+    def prefetch_today(self, hd=True):
+        """Download today's APOD as soon as it is published"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        client = self.app.apod_client
+        if client.get_cached_image(today, hd):
+            return
+
+        if client.download_image(today, silent=True, hd=hd):
+            print(f"Prefetched APOD for {today}")
+
+    def prefetch_random(self, hd=True):
+        """Download the next random image so the next update is instant"""
+        entry = self.app.config.get_prefetched_random()
+        if entry and entry.get("hd") == hd and os.path.exists(entry.get("path", "")):
+            return
+
+        result = self.app.apod_client.download_image(silent=True, hd=hd, random_date=True)
+        if result:
+            image_path, apod_data = result
+            self.app.config.set_prefetched_random({
+                "path": image_path,
+                "date": apod_data.get("date"),
+                "hd": hd
+            })
+            print(f"Prefetched random APOD {image_path}")
+
+    def take_random(self, hd=True):
+        """Take the prefetched random image, if one is ready"""
+        entry = self.app.config.get_prefetched_random()
+        if not entry:
+            return None
+
+        self.app.config.set_prefetched_random(None)
+        image_path = entry.get("path", "")
+        if entry.get("hd") != hd or not os.path.exists(image_path):
+            return None
+        return image_path, {"date": entry.get("date"), "media_type": "image"}
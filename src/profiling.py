@@ -0,0 +1,139 @@
+"""
+On-demand CPU and memory profiling for diagnosing freezes and leaks
+
+Off by default. Switch it on with the APODPAPER_PROFILE environment
+variable, "profiling": true in config.json or the hidden tray item; reports
+are written to the profiles folder next to the images.
+"""
+import io
+import os
+import glob
+import pstats
+import cProfile
+import functools
+import threading
+import tracemalloc
+from datetime import datetime
+
+
+ENV_VAR = "APODPAPER_PROFILE"
+
+
+def requested_by_environment():
+    """Check if profiling was asked for through the environment"""
+    return os.environ.get(ENV_VAR, "").lower() in ("1", "true", "yes", "on")
+
+
+class Profiler:
+    # Oldest reports are deleted beyond this many
+    MAX_REPORTS = 100
+    # Functions shown per CPU report, and allocation sites per memory report
+    REPORT_LINES = 40
+    # Stack depth tracemalloc records for each allocation
+    TRACEBACK_FRAMES = 10
+
+    def __init__(self, apod_folder):
+        self.folder = os.path.join(apod_folder, "profiles")
+        self.enabled = False
+        self._lock = threading.Lock()
+        # Only one cProfile can be active in a process at a time
+        self._active = threading.Lock()
+        self._baseline = None
+
+    def enable(self):
+        """Start profiling wrapped calls and tracking allocations"""
+        with self._lock:
+            if self.enabled:
+                return
+            os.makedirs(self.folder, exist_ok=True)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.TRACEBACK_FRAMES)
+            self._baseline = tracemalloc.take_snapshot()
+            self.enabled = True
+        print(f"Profiling enabled, reports go to {self.folder}")
+
+    def disable(self):
+        """Stop profiling, writing a last memory report"""
+        if not self.enabled:
+            return
+        self.snapshot_memory("final")
+        with self._lock:
+            self.enabled = False
+            self._baseline = None
+            tracemalloc.stop()
+        print("Profiling disabled")
+
+    def set_enabled(self, enabled):
+        if enabled:
+            self.enable()
+        else:
+            self.disable()
+
+    def wrap(self, func, name=None):
+        """Wrap a callable so it is profiled while profiling is on
+
+        When off, the wrapper costs one attribute check per call.
+        """
+        name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            return self.profile_call(name, func, *args, **kwargs)
+        return wrapper
+
+    def profile_call(self, name, func, *args, **kwargs):
+        """Run a call under cProfile and write CPU and memory reports for it
+
+        Calls made while another one is being profiled (nested, or on another
+        thread) run unprofiled; nested ones show up in the outer report.
+        """
+        if not self._active.acquire(blocking=False):
+            return func(*args, **kwargs)
+
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            self._active.release()
+            try:
+                stream = io.StringIO()
+                pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(self.REPORT_LINES)
+                self._write_report(f"cpu_{name}", stream.getvalue())
+                if self.enabled:
+                    self.snapshot_memory(name)
+            except Exception as e:
+                print(f"Could not write profile for {name}: {e}")
+
+    def snapshot_memory(self, label):
+        """Write the allocation sites that grew most since profiling started"""
+        if not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+
+        lines = [f"Traced memory: {current / 2**20:.1f} MB (peak {peak / 2**20:.1f} MB)", ""]
+        baseline = self._baseline
+        if baseline is not None:
+            lines.append("Growth since profiling started:")
+            stats = snapshot.compare_to(baseline, "lineno")
+        else:
+            stats = snapshot.statistics("lineno")
+        lines.extend(str(stat) for stat in stats[:self.REPORT_LINES])
+        self._write_report(f"memory_{label}", "\n".join(lines) + "\n")
+
+    def _write_report(self, name, text):
+        """Write a timestamped report and prune the oldest ones"""
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, f"{datetime.now():%Y%m%d-%H%M%S-%f}_{name}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+        reports = sorted(glob.glob(os.path.join(self.folder, "*.txt")))
+        for old_report in reports[:-self.MAX_REPORTS]:
+            try:
+                os.remove(old_report)
+            except OSError:
+                pass
+        return path
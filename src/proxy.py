@@ -0,0 +1,177 @@
+"""
+Shared caching proxy for the APOD API
+
+Serves APOD metadata and images to many APODPaper clients from one local
+store, so a site fetches each day's metadata and image from NASA once no
+matter how many machines ask. Clients point their api_base_url at
+http://<proxy>/planetary/apod.
+"""
+import os
+import json
+import time
+import shutil
+import mimetypes
+import threading
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+try:
+    from .apod_client import APODClient
+except ImportError:
+    from apod_client import APODClient
+
+
+# Upstream hosts the proxy is willing to fetch images from
+ALLOWED_IMAGE_HOSTS = ("apod.nasa.gov", "img.youtube.com", "i.vimeocdn.com")
+
+
+class APODProxy:
+    # How long today's metadata is reused before asking NASA again
+    TODAY_TTL = 10 * 60
+
+    def __init__(self, api_key, apod_folder, catalog, image_store, public_url=None):
+        # Always talk to NASA directly, whatever the local config points at
+        self.client = APODClient(api_key, apod_folder, catalog, image_store)
+        self.catalog = catalog
+        self.image_store = image_store
+        self.public_url = public_url
+        self._today = (0, None)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get_metadata(self, date=None):
+        """Get metadata for a date (or today), fetching from NASA at most once"""
+        if date:
+            entry = self.catalog.get(date)
+            if entry:
+                return entry
+            with self._key_lock(date):
+                return self.client.get_apod_data(date, hd=True)
+
+        # Requests that arrive while today's fetch is running share its result
+        with self._key_lock("today"):
+            fetched_at, data = self._today
+            if data is None or time.monotonic() - fetched_at > self.TODAY_TTL:
+                data = self.client.get_apod_data(hd=True)
+                self._today = (time.monotonic(), data)
+            return data
+
+    def get_range(self, start_date, end_date):
+        """Get metadata for a date range, from the catalog when complete"""
+        start = datetime.strptime(start_date, "%Y-%m-%d")
+        end = datetime.strptime(end_date, "%Y-%m-%d")
+        entries = []
+        day = start
+        while day <= end:
+            entry = self.catalog.get(day.strftime("%Y-%m-%d"))
+            if entry is None:
+                break
+            entries.append(entry)
+            day += timedelta(days=1)
+        else:
+            return entries
+
+        with self._key_lock(f"{start_date}:{end_date}"):
+            return self.client.get_apod_range(start_date, end_date)
+
+    def get_image(self, upstream_url):
+        """Get the local blob for an upstream image URL, downloading it once"""
+        host = urlparse(upstream_url).hostname or ""
+        if host not in ALLOWED_IMAGE_HOSTS:
+            raise PermissionError(f"Image host {host} is not allowed")
+        return self.image_store.fetch(upstream_url)
+
+    def rewrite(self, data, base_url):
+        """Point image URLs in metadata at this proxy"""
+        data = dict(data)
+        for field in ("url", "hdurl", "thumbnail_url"):
+            url = data.get(field)
+            if not url:
+                continue
+            parsed = urlparse(url)
+            if parsed.hostname in ALLOWED_IMAGE_HOSTS:
+                data[field] = f"{base_url}/images/{parsed.hostname}{parsed.path}"
+        return data
+
+
+class ProxyRequestHandler(BaseHTTPRequestHandler):
+    server_version = "APODPaperProxy/1.0"
+
+    @property
+    def proxy(self):
+        return self.server.apod_proxy
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        try:
+            if parsed.path.rstrip("/") == "/planetary/apod":
+                self._serve_metadata(parse_qs(parsed.query))
+            elif parsed.path.startswith("/images/"):
+                self._serve_image(parsed.path[len("/images/"):])
+            else:
+                self._send_json(404, {"error": "Not found"})
+        except PermissionError as e:
+            self._send_json(403, {"error": str(e)})
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            self._send_json(502, {"error": f"Upstream request failed: {e}"})
+
+    def _base_url(self):
+        if self.proxy.public_url:
+            return self.proxy.public_url.rstrip("/")
+        host = self.headers.get("Host") or f"{self.server.server_address[0]}:{self.server.server_address[1]}"
+        return f"http://{host}"
+
+    def _serve_metadata(self, query):
+        base_url = self._base_url()
+        start_date = query.get("start_date", [None])[0]
+        if start_date:
+            end_date = query.get("end_date", [datetime.now().strftime("%Y-%m-%d")])[0]
+            entries = self.proxy.get_range(start_date, end_date)
+            self._send_json(200, [self.proxy.rewrite(entry, base_url) for entry in entries])
+            return
+
+        data = self.proxy.get_metadata(query.get("date", [None])[0])
+        self._send_json(200, self.proxy.rewrite(data, base_url))
+
+    def _serve_image(self, host_and_path):
+        host, _, path = host_and_path.partition("/")
+        blob_path = self.proxy.get_image(f"https://{host}/{path}")
+
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(os.path.getsize(blob_path)))
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        self.end_headers()
+        with open(blob_path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print(f"[proxy] {self.address_string()} {format % args}")
+
+
+def serve(apod_proxy, host="0.0.0.0", port=8080):
+    """Run the proxy until interrupted"""
+    server = ThreadingHTTPServer((host, port), ProxyRequestHandler)
+    server.daemon_threads = True
+    server.apod_proxy = apod_proxy
+    print(f"APOD proxy listening on http://{host}:{port}/planetary/apod")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
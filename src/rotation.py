@@ -0,0 +1,165 @@
+"""
+Wallpaper rotation over the local APOD library
+"""
+import os
+import json
+import random
+import threading
+from datetime import datetime
+
+try:
+    from .apod_client import IMAGE_NAME_PATTERN
+    from .thumbnails import make_derivative, derivative_path_for
+except ImportError:
+    from apod_client import IMAGE_NAME_PATTERN
+    from thumbnails import make_derivative, derivative_path_for
+
+
+class RotationManager:
+    def __init__(self, app_controller):
+        self.app = app_controller
+        self.playlist_path = os.path.join(self.app.config.apod_folder, "playlist.json")
+        self.derivatives_folder = os.path.join(self.app.config.apod_folder, "derivatives")
+        self.playlist = None
+        self._lock = threading.Lock()
+
+    def list_library(self):
+        """List downloaded images as (date, path), preferring HD per date"""
+        images = {}
+        for filename in os.listdir(self.app.config.apod_folder):
+            match = IMAGE_NAME_PATTERN.match(filename)
+            if not match:
+                continue
+            date = datetime.strptime(match.group(1), "%Y%m%d").strftime("%Y-%m-%d")
+            if date in images and not match.group(2):
+                continue
+            images[date] = os.path.join(self.app.config.apod_folder, filename)
+        return sorted(images.items())
+
+    def build_playlist(self):
+        """Build and persist a new playlist from the current library"""
+        order = self.app.config.get_rotation_order()
+        start_date, end_date = self.app.config.get_rotation_date_range()
+
+        entries = [
+            (date, path) for date, path in self.list_library()
+            if (not start_date or date >= start_date) and (not end_date or date <= end_date)
+        ]
+
+        if order == "shuffle":
+            random.shuffle(entries)
+        elif order == "weighted":
+            entries = self._weighted_shuffle(entries)
+
+        screen_size = self.app.wallpaper_manager.get_screen_size()
+        playlist = {
+            "order": order,
+            "start_date": start_date,
+            "end_date": end_date,
+            "screen_size": list(screen_size),
+            "position": -1,
+            "entries": [
+                {"date": date, "source": path, "derivative": derivative_path_for(self.derivatives_folder, path, screen_size)}
+                for date, path in entries
+            ]
+        }
+
+        with self._lock:
+            self.playlist = playlist
+            self._save_playlist()
+
+        # Scale everything up front so rotation ticks never decode images
+        threading.Thread(target=self.build_derivatives, daemon=True).start()
+        return playlist
+
+    def _weighted_shuffle(self, entries):
+        """Shuffle so that recent images tend to come first"""
+        today = datetime.now()
+
+        def sort_key(entry):
+            age_days = max((today - datetime.strptime(entry[0], "%Y-%m-%d")).days, 0)
+            weight = 1.0 / (1.0 + age_days / 365.0)
+            # Weighted random sampling without replacement (Efraimidis-Spirakis)
+            return random.random() ** (1.0 / weight)
+
+        return sorted(entries, key=sort_key, reverse=True)
+
+    def build_derivatives(self):
+        """Create screen-sized copies for every playlist entry"""
+        playlist = self.playlist
+        if not playlist:
+            return
+
+        os.makedirs(self.derivatives_folder, exist_ok=True)
+        screen_size = tuple(playlist["screen_size"])
+        for entry in playlist["entries"]:
+            derivative = entry["derivative"]
+            if os.path.exists(derivative):
+                continue
+            try:
+                make_derivative(entry["source"], derivative, screen_size)
+            except Exception as e:
+                print(f"Could not create derivative for {entry['source']}: {e}")
+
+    def load_playlist(self):
+        """Load the persisted playlist, building one if needed"""
+        if self.playlist is not None:
+            return self.playlist
+
+        try:
+            with open(self.playlist_path, "r") as f:
+                playlist = json.load(f)
+        except (OSError, ValueError):
+            return self.build_playlist()
+
+        # Rebuild if the settings or screen changed since it was made
+        start_date, end_date = self.app.config.get_rotation_date_range()
+        if (playlist.get("order") != self.app.config.get_rotation_order()
+                or playlist.get("start_date") != start_date
+                or playlist.get("end_date") != end_date
+                or tuple(playlist.get("screen_size", ())) != self.app.wallpaper_manager.get_screen_size()):
+            return self.build_playlist()
+
+        self.playlist = playlist
+        return playlist
+
+    def invalidate(self):
+        """Forget the in-memory playlist so settings changes are picked up"""
+        with self._lock:
+            self.playlist = None
+
+    def discard(self):
+        """Forget the playlist on disk as well, e.g. after the library was deleted"""
+        with self._lock:
+            self.playlist = None
+            try:
+                os.remove(self.playlist_path)
+            except FileNotFoundError:
+                pass
+
+    def _save_playlist(self):
+        """Persist the playlist and current position"""
+        temp_path = self.playlist_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.playlist, f)
+        os.replace(temp_path, self.playlist_path)
+
+    def tick(self):
+        """Apply the next image in the playlist"""
+        playlist = self.load_playlist()
+        if playlist["position"] + 1 >= len(playlist["entries"]):
+            # Start a fresh pass, picking up newly downloaded images
+            playlist = self.build_playlist()
+            if not playlist["entries"]:
+                return False
+
+        with self._lock:
+            playlist["position"] += 1
+            entry = playlist["entries"][playlist["position"]]
+            self._save_playlist()
+
+        # Fall back to the original until its derivative is ready
+        image_path = entry["derivative"] if os.path.exists(entry["derivative"]) else entry["source"]
+        if not os.path.exists(image_path):
+            return False
+        return self.app.apply_wallpaper(image_path, entry["date"], "rotation")
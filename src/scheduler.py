@@ -1,55 +1,225 @@
 """
 Scheduling and background tasks for APODPaper
 """
-import schedule
+import os
+import json
 import time
 import threading
-from datetime import datetime
+from datetime import datetime, timedelta
+
+
+class Job:
+    def __init__(self, name, func, every=None, at=None, tag=None, persist=False):
+        """A job runs every `every` seconds, or daily at `at` ("HH:MM" local time)
+
+        Persisted jobs remember their last run across restarts, so a run
+        that fell due while the app was closed happens once at startup.
+        """
+        self.name = name
+        self.func = func
+        self.every = every
+        self.at = at
+        self.tag = tag
+        self.persist = persist
+        self.last_run = None
+        self.next_run = None
+
+    def compute_next(self, after):
+        """Get the first run time strictly after a wall-clock timestamp"""
+        if self.every:
+            return after + self.every
+        hour, minute = map(int, self.at.split(":"))
+        candidate = datetime.fromtimestamp(after).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate.timestamp() <= after:
+            candidate += timedelta(days=1)
+        return candidate.timestamp()
 
 
 class Scheduler:
+    # Longest the loop sleeps, so clock changes are noticed even when idle
+    MAX_SLEEP_SECONDS = 300
+
+    # Waking this much later than planned means sleep, hibernation or a clock change
+    CLOCK_JUMP_SECONDS = 120
+
+    # Background work that fell due together with an update waits this long for it
+    DEFER_SECONDS = 5 * 60
+
     def __init__(self, app_controller):
         self.app = app_controller
         self.running = False
         self.thread = None
-    
+        self.state_path = os.path.join(app_controller.config.apod_folder, "scheduler_state.json")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def add_job(self, name, func, every=None, at=None, tag=None, persist=False):
+        """Add or replace a job"""
+        job = Job(name, func, every, at, tag, persist)
+        now = time.time()
+        last_run = self._load_state().get(name) if persist else None
+        if last_run is not None:
+            job.last_run = min(last_run, now)
+        job.next_run = job.compute_next(job.last_run if job.last_run is not None else now)
+        with self._lock:
+            self._jobs[name] = job
+        self._wake.set()
+        return job
+
+    def clear(self, tag=None):
+        """Remove all jobs, or just those with a tag"""
+        with self._lock:
+            for name in [name for name, job in self._jobs.items() if tag is None or job.tag == tag]:
+                del self._jobs[name]
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        """Persist last-run times of persisted jobs; caller holds the lock"""
+        state = self._load_state()
+        state.update({name: job.last_run for name, job in self._jobs.items() if job.persist and job.last_run})
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
     def setup_schedule(self):
         """Set up the scheduling tasks"""
         # Clear any existing jobs
-        schedule.clear()
-        
+        self.clear()
+
+        # Prefetch the next image in the background so updates are local swaps
+        self.add_job("prefetch", self.app.prefetcher.request_prefetch, every=30 * 60, tag="background")
+
+        # Keep the library in step with corrections NASA makes, a batch at a time
+        self.add_job("revalidate_library", self.app.prefetcher.request_revalidation,
+                     every=6 * 60 * 60, tag="background", persist=True)
+
+        # Catch up quickly after having been offline
+        self.add_job("revalidate_if_stale", self.app.revalidate_if_stale, every=5 * 60)
+        self.add_job("memory_check", self.app.memory.check, every=10 * 60)
+
+        self.schedule_updates()
+        self.schedule_rotation()
+
+    def schedule_updates(self):
+        """(Re)create the wallpaper update jobs from the current settings"""
+        self.clear("updates")
+        config = self.app.config.get_config()
+        if not config.get("auto_update", True):
+            return
+
+        update = self.app.check_and_update_wallpaper
+
         # Schedule checks every hour
-        schedule.every().hour.do(self.app.check_and_update_wallpaper)
-        
+        self.add_job("update_hourly", update, every=60 * 60, tag="updates", persist=True)
+
         # Schedule daily check at 9 AM
-        schedule.every().day.at("09:00").do(self.app.check_and_update_wallpaper)
-        
+        self.add_job("update_daily", update, at="09:00", tag="updates", persist=True)
+
         # You can add more scheduling options here based on user preferences
-        config = self.app.config.get_config()
         frequency = config.get("update_frequency", "daily")
-        
+
         if frequency == "6hours":
-            schedule.every(6).hours.do(self.app.check_and_update_wallpaper)
+            self.add_job("update_frequency", update, every=6 * 60 * 60, tag="updates", persist=True)
         elif frequency == "12hours":
-            schedule.every(12).hours.do(self.app.check_and_update_wallpaper)
-    
+            self.add_job("update_frequency", update, every=12 * 60 * 60, tag="updates", persist=True)
+
+    def schedule_rotation(self):
+        """(Re)create the rotation job; cycles through the local library if enabled"""
+        self.clear("rotation")
+        if self.app.config.get_rotation_enabled():
+            interval = self.app.config.get_rotation_interval()
+            self.add_job("rotation", self.app.rotation.tick, every=interval * 60, tag="rotation")
+
+    def run_pending(self):
+        """Run every due job, folding all missed runs of a function into one call
+
+        Updates run first. Background work due in the same pass (typically
+        after resuming from sleep) is put off briefly rather than racing the
+        update for the same API calls.
+        """
+        now = time.time()
+        with self._lock:
+            due = [job for job in self._jobs.values() if job.next_run <= now]
+            if any(job.tag == "updates" for job in due):
+                for job in due:
+                    if job.tag == "background":
+                        job.next_run = now + self.DEFER_SECONDS
+                due = [job for job in due if job.tag != "background"]
+            # Stable sort: updates first, the rest in the order they were added
+            due.sort(key=lambda job: job.tag != "updates")
+            for job in due:
+                job.last_run = now
+                # Missed runs aren't replayed; the next run is the next slot from now
+                job.next_run = job.compute_next(now)
+            if any(job.persist for job in due):
+                self._save_state()
+
+        # Several jobs may share a function (hourly and 9 AM update checks, ...)
+        funcs = []
+        for job in due:
+            if job.func not in funcs:
+                funcs.append(job.func)
+
+        for func in funcs:
+            try:
+                func()
+            except Exception as e:
+                print(f"Scheduled job {getattr(func, '__name__', func)} failed: {e}")
+
+    def _seconds_until_next(self):
+        with self._lock:
+            next_runs = [job.next_run for job in self._jobs.values()]
+        if not next_runs:
+            return self.MAX_SLEEP_SECONDS
+        return min(max(min(next_runs) - time.time(), 1), self.MAX_SLEEP_SECONDS)
+
+    def _on_clock_jump(self, expected, now):
+        """Handle waking far from the planned time (sleep, hibernation, clock change)"""
+        print(f"Clock jumped by {now - expected:+.0f}s, catching up")
+        if now < expected:
+            # The clock went back; don't wait out the difference
+            with self._lock:
+                for job in self._jobs.values():
+                    job.next_run = min(job.next_run, job.compute_next(now))
+        # After a jump forward, every overdue job is simply due and runs once
+
     def run_scheduler(self):
         """Main scheduler loop"""
         self.running = True
         while self.running:
-            schedule.run_pending()
-            time.sleep(60)  # Check every minute
-    
+            self.run_pending()
+
+            # Sleep until the next job is due instead of polling
+            timeout = self._seconds_until_next()
+            expected = time.time() + timeout
+            # Also woken early when jobs change or the scheduler stops
+            woken = self._wake.wait(timeout)
+            self._wake.clear()
+
+            now = time.time()
+            if not woken and abs(now - expected) > self.CLOCK_JUMP_SECONDS:
+                self._on_clock_jump(expected, now)
+
     def start(self):
         """Start the scheduler in a background thread"""
         if not self.thread or not self.thread.is_alive():
             self.setup_schedule()
+            self._wake.clear()
             self.thread = threading.Thread(target=self.run_scheduler, daemon=True)
             self.thread.start()
             print("Scheduler started")
-    
+
     def stop(self):
         """Stop the scheduler"""
         self.running = False
-        schedule.clear()
+        self._wake.set()
+        self.clear()
         print("Scheduler stopped")
@@ -7,6 +7,9 @@ from PIL import Image, ImageDraw
 
 
 class SystemTray:
+    # Tray icons are shown at 16-32 px; a small source keeps the icon cheap to hold
+    ICON_SIZE = 64
+
     def __init__(self, app_controller):
         self.app = app_controller
         self.icon = None
@@ -21,25 +24,49 @@ class SystemTray:
     def get_icon_image(self):
         """Get the icon image from file or create a default one"""
         if os.path.exists("assets/icon.png"):
-            image = Image.open("assets/icon.png")
-            image = image.resize((256, 256), Image.Resampling.LANCZOS)
-            return image
+            # Close the file so the full-size source isn't kept around
+            with Image.open("assets/icon.png") as image:
+                return image.resize((self.ICON_SIZE, self.ICON_SIZE), Image.Resampling.LANCZOS)
         else:
-            return self.create_icon_image(256, 256)
+            return self.create_icon_image(self.ICON_SIZE, self.ICON_SIZE)
     
     def create_menu(self):
         """Create the system tray context menu"""
+        # Menu actions are profiled while profiling is on
+        profiled = self.app.profiler.wrap
         return pystray.Menu(
-            pystray.MenuItem("Update Wallpaper", self.app.manual_update),
-            pystray.MenuItem("Toggle Auto-Update", self.app.toggle_auto_update),
-            pystray.MenuItem("Clean Up", self.app.clean_folder),
+            pystray.MenuItem("Update Wallpaper", profiled(self.app.manual_update)),
+            pystray.MenuItem("Previous Wallpaper", profiled(self.app.previous_wallpaper)),
+            pystray.MenuItem("Next Wallpaper", profiled(self.app.next_wallpaper)),
+            pystray.MenuItem("Set Wallpaper From...", profiled(self.app.show_catalog_search)),
+            pystray.MenuItem("Gallery", profiled(self.app.show_gallery)),
+            pystray.MenuItem("Toggle Auto-Update", profiled(self.app.toggle_auto_update)),
+            pystray.MenuItem("Clean Up", profiled(self.app.clean_folder)),
             pystray.Menu.SEPARATOR,
-            pystray.MenuItem("Settings", self.app.show_settings),
-            pystray.MenuItem("About", self.app.show_about),
+            pystray.MenuItem("Settings", profiled(self.app.show_settings)),
+            pystray.MenuItem("About", profiled(self.app.show_about)),
+            # Hidden unless diagnostics are enabled
+            pystray.MenuItem(
+                "Profiling",
+                self.app.toggle_profiling,
+                checked=lambda item: self.app.profiler.enabled,
+                visible=lambda item: self.app.debug_menu_visible()
+            ),
             pystray.Menu.SEPARATOR,
-            pystray.MenuItem("Quit", self.quit_app)
+            pystray.MenuItem("Quit", self.app.quit_app)
         )
     
+    def notify(self, title, message):
+        """Show a balloon notification from the tray icon, if supported"""
+        if not self.icon or not getattr(self.icon, "HAS_NOTIFICATION", False):
+            return False
+        try:
+            self.icon.notify(message, title)
+            return True
+        except Exception as e:
+            print(f"Failed to show tray notification: {e}")
+            return False
+
     def quit_app(self, icon=None, item=None):
         """Quit the application"""
         if self.icon:
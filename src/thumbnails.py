@@ -0,0 +1,66 @@
+"""
+Thumbnails and screen-sized derivatives of APOD images
+"""
+import os
+
+
+THUMBNAIL_SIZE = (200, 150)
+
+
+def make_thumbnail(source_path, thumbnail_path, size=THUMBNAIL_SIZE):
+    """Write a small JPEG thumbnail of an image
+
+    A module-level function so process pools can run it as well.
+    """
+    from PIL import Image
+
+    with Image.open(source_path) as image:
+        # JPEG decodes straight at a fraction of full size, skipping most work
+        image.draft("RGB", size)
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        thumbnail = image.convert("RGB")
+
+    partial_path = thumbnail_path + ".part"
+    thumbnail.save(partial_path, "JPEG", quality=85)
+    os.replace(partial_path, thumbnail_path)
+    return thumbnail_path
+
+
+def derivative_path_for(derivatives_folder, source_path, size):
+    """Get where the screen-sized copy of an image is stored"""
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(derivatives_folder, f"{name}_{size[0]}x{size[1]}.jpg")
+
+
+def make_derivative(source_path, derivative_path, size):
+    """Write a JPEG copy of an image scaled and cropped to fill a screen size"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        # Let the JPEG decoder skip detail we would throw away anyway
+        image.draft("RGB", size)
+        scaled = ImageOps.fit(image.convert("RGB"), size, Image.Resampling.LANCZOS)
+
+    partial_path = derivative_path + ".part"
+    scaled.save(partial_path, "JPEG", quality=92)
+    os.replace(partial_path, derivative_path)
+    return derivative_path
+
+
+class ThumbnailCache:
+    def __init__(self, apod_folder, size=THUMBNAIL_SIZE):
+        self.folder = os.path.join(apod_folder, "thumbnails")
+        self.size = size
+        os.makedirs(self.folder, exist_ok=True)
+
+    def path_for(self, source_path):
+        """Get where the thumbnail of an image is cached"""
+        name = os.path.splitext(os.path.basename(source_path))[0]
+        return os.path.join(self.folder, f"{name}_{self.size[0]}x{self.size[1]}.jpg")
+
+    def get(self, source_path):
+        """Get the cached thumbnail path, creating the thumbnail if needed"""
+        thumbnail_path = self.path_for(source_path)
+        if os.path.exists(thumbnail_path) and os.path.getmtime(thumbnail_path) >= os.path.getmtime(source_path):
+            return thumbnail_path
+        return make_thumbnail(source_path, thumbnail_path, self.size)
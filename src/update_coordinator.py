@@ -0,0 +1,80 @@
+"""
+Single-flight coordination of wallpaper updates for APODPaper
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class UpdateQueueFull(Exception):
+    """Raised when too many different update requests are waiting"""
+
+
+class UpdateCoordinator:
+    def __init__(self, perform_update, max_pending=2):
+        self.perform_update = perform_update
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._current = None
+        self._pending = OrderedDict()
+        self._worker = None
+
+    def submit(self, **request):
+        """Request an update and return a Future for its result
+
+        Requests with the same arguments as the running or a queued update
+        share that update's Future instead of starting a duplicate.
+        """
+        key = tuple(sorted(request.items()))
+
+        with self._lock:
+            if self._current is not None and self._current[0] == key:
+                return self._current[1]
+            if key in self._pending:
+                return self._pending[key][1]
+
+            future = Future()
+            if len(self._pending) >= self.max_pending:
+                future.set_exception(UpdateQueueFull("Too many updates are already waiting"))
+                return future
+
+            self._pending[key] = (request, future)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+            return future
+
+    def is_busy(self):
+        """Check if an update is running or waiting"""
+        with self._lock:
+            return self._current is not None or bool(self._pending)
+
+    def _run(self):
+        """Worker loop running queued updates one at a time"""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._current = None
+                    self._worker = None
+                    return
+                key, (request, future) = self._pending.popitem(last=False)
+                self._current = (key, future)
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            result, error = None, None
+            try:
+                result = self.perform_update(**request)
+            except Exception as e:
+                error = e
+
+            # Mark the update finished before waking callers, so follow-up
+            # work started from done callbacks doesn't see us as busy
+            with self._lock:
+                self._current = None
+
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
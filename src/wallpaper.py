@@ -22,6 +22,14 @@ class WallpaperManager:
             print(f"Failed to set wallpaper: {e}")
             return False
     
+    def get_screen_size(self):
+        """Get the primary screen resolution in pixels"""
+        try:
+            user32 = ctypes.windll.user32
+            return user32.GetSystemMetrics(0), user32.GetSystemMetrics(1)
+        except Exception:
+            return 1920, 1080
+    
     def is_supported(self):
         """Check if wallpaper setting is supported on this system"""
         try: